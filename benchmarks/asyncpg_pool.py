@@ -0,0 +1,129 @@
+"""Compare SQLAlchemy's pool with ``asyncpg.Pool`` for ``asyncpgrdsiam``.
+
+Usage::
+
+    python benchmarks/asyncpg_pool.py postgresql+asyncpgrdsiam://user@host/db
+
+Each checkout runs ``SELECT 1``, through:
+
+- SQLAlchemy with ``AsyncAdaptedQueuePool``, its default pool.
+- SQLAlchemy with ``NullPool`` on top of ``asyncpg.Pool``, where each
+  checkout acquires a connection from ``asyncpg.Pool``.
+- ``asyncpg.Pool`` alone, without SQLAlchemy.
+
+``asyncpg>=0.30`` and ``sqlalchemy>=2.0.16`` are required.
+
+Copyright 2022 Cisco Systems, Inc.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    https://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import argparse
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict
+
+import asyncpg
+import sqlalchemy
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from sqlalchemy.pool import NullPool
+
+from sqlalchemy_rdsiam import dbapi_asyncpg
+
+
+class _PoolConnection:
+    """Connection acquired from an ``asyncpg.Pool``, which closing releases."""
+
+    def __init__(self, pool: asyncpg.Pool, con: Any) -> None:
+        self._pool = pool
+        self._con = con
+
+    def __getattr__(self, attr: str) -> Any:
+        return getattr(self._con, attr)
+
+    async def close(self, *, timeout: Any = None) -> None:
+        await self._pool.release(self._con, timeout=timeout)
+
+
+async def _engine_checkout(engine: AsyncEngine) -> None:
+    async with engine.connect() as conn:
+        await conn.execute(sqlalchemy.text("SELECT 1"))
+
+
+async def _bench(
+    checkout: Callable[[], Awaitable[None]], concurrency: int, iterations: int
+) -> float:
+    async def _worker(count: int) -> None:
+        for _ in range(count):
+            await checkout()
+
+    # Warm up the pool
+    await asyncio.gather(*(_worker(1) for _ in range(concurrency)))
+
+    start = time.perf_counter()
+    await asyncio.gather(*(_worker(iterations) for _ in range(concurrency)))
+
+    return concurrency * iterations / (time.perf_counter() - start)
+
+
+async def _create_pool(url: str, size: int) -> asyncpg.Pool:
+    dialect = create_async_engine(url).dialect
+    _, cparams = dialect.create_connect_args(sqlalchemy.engine.make_url(url))
+
+    async def _connect(*args: Any, **kwargs: Any) -> Any:
+        # Every new connection gets its own IAM authentication token
+        return await dbapi_asyncpg.connect(**cparams)
+
+    return await asyncpg.create_pool(connect=_connect, min_size=size, max_size=size)
+
+
+async def _main(args: argparse.Namespace) -> None:
+    size = args.concurrency
+    results: Dict[str, float] = {}
+
+    engine = create_async_engine(args.url, pool_size=size, max_overflow=0)
+    results["AsyncAdaptedQueuePool"] = await _bench(
+        lambda: _engine_checkout(engine), args.concurrency, args.iterations
+    )
+    await engine.dispose()
+
+    pool = await _create_pool(args.url, size)
+
+    async def _acquire() -> _PoolConnection:
+        return _PoolConnection(pool, await pool.acquire())
+
+    engine = create_async_engine(args.url, poolclass=NullPool, async_creator=_acquire)
+    results["NullPool on asyncpg.Pool"] = await _bench(
+        lambda: _engine_checkout(engine), args.concurrency, args.iterations
+    )
+    await engine.dispose()
+
+    async def _pool_checkout() -> None:
+        async with pool.acquire() as con:
+            await con.fetchval("SELECT 1")
+
+    results["asyncpg.Pool alone"] = await _bench(
+        _pool_checkout, args.concurrency, args.iterations
+    )
+    await pool.close()
+
+    for name, rate in results.items():
+        print(f"{name:>26}: {rate:10.1f} checkouts/s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("url", help="postgresql+asyncpgrdsiam URL")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--iterations", type=int, default=500)
+
+    asyncio.run(_main(parser.parse_args()))
@@ -0,0 +1,79 @@
+"""Compare batch token generation with per-call ``boto3`` signing.
+
+Usage::
+
+    python benchmarks/tokens.py --instances 500
+
+Tokens are signed locally, so no AWS access is needed: dummy credentials
+are used when none are set in the environment.
+
+Copyright 2022 Cisco Systems, Inc.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    https://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import argparse
+import os
+import time
+from typing import Callable
+
+from sqlalchemy_rdsiam.rds import rds_client
+from sqlalchemy_rdsiam.tokens import generate_db_auth_tokens
+
+
+def _bench(fn: Callable[[], None], rounds: int) -> float:
+    fn()
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        fn()
+
+    return (time.perf_counter() - start) / rounds
+
+
+def main(args: argparse.Namespace) -> None:
+    os.environ.setdefault("AWS_ACCESS_KEY_ID", "AKIDEXAMPLE")
+    os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "secret")
+
+    endpoints = [
+        (f"instance-{i}.abcdefghij.{args.region}.rds.amazonaws.com", 5432, "app")
+        for i in range(args.instances)
+    ]
+
+    def _boto3() -> None:
+        client = rds_client(args.region)
+
+        for host, port, user in endpoints:
+            client.generate_db_auth_token(DBHostname=host, Port=port, DBUsername=user)
+
+    def _batch() -> None:
+        generate_db_auth_tokens(endpoints, args.region)
+
+    results = {
+        "boto3 (per call)": _bench(_boto3, args.rounds),
+        "generate_db_auth_tokens": _bench(_batch, args.rounds),
+    }
+
+    for name, duration in results.items():
+        print(
+            f"{name:>24}: {duration * 1000:8.2f} ms per batch,"
+            f" {args.instances / duration:10.0f} tokens/s"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--instances", type=int, default=500)
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--region", default="us-east-1")
+
+    main(parser.parse_args())
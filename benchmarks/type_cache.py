@@ -0,0 +1,108 @@
+"""Measure the first query of fresh ``asyncpgrdsiam`` connections with and
+without the shared type cache.
+
+Usage::
+
+    python benchmarks/type_cache.py postgresql+asyncpgrdsiam://user@host/db
+
+The first query uses an enum, an array of it and a composite type, which
+``asyncpg`` introspects on each connection unless the cache is enabled.
+The types are created if needed, so the user must be allowed to.
+
+Copyright 2022 Cisco Systems, Inc.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    https://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from typing import List
+
+import sqlalchemy
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import NullPool
+
+_setup_statements = [
+    """
+    DO $$ BEGIN
+        CREATE TYPE rds_bench_mood AS ENUM ('happy', 'sad');
+    EXCEPTION WHEN duplicate_object THEN NULL;
+    END $$
+    """,
+    """
+    DO $$ BEGIN
+        CREATE TYPE rds_bench_pair AS (mood rds_bench_mood, note text);
+    EXCEPTION WHEN duplicate_object THEN NULL;
+    END $$
+    """,
+]
+
+_query = """
+SELECT
+    'happy'::rds_bench_mood,
+    ARRAY['sad'::rds_bench_mood],
+    ROW('happy', 'ok')::rds_bench_pair
+"""
+
+
+async def _bench(url: str, connections: int) -> List[float]:
+    # Every connection is fresh without a pool
+    engine = create_async_engine(url, poolclass=NullPool)
+    query = sqlalchemy.text(_query)
+    latencies = []
+
+    for _ in range(connections):
+        async with engine.connect() as conn:
+            start = time.perf_counter()
+            await conn.execute(query)
+            latencies.append(time.perf_counter() - start)
+
+    await engine.dispose()
+
+    return latencies
+
+
+async def _main(args: argparse.Namespace) -> None:
+    engine = create_async_engine(args.url, poolclass=NullPool)
+
+    async with engine.begin() as conn:
+        for statement in _setup_statements:
+            await conn.execute(sqlalchemy.text(statement))
+
+    await engine.dispose()
+
+    sep = "&" if "?" in args.url else "?"
+    results = {
+        "without cache": await _bench(args.url, args.connections),
+        "rds_type_cache": await _bench(
+            f"{args.url}{sep}rds_type_cache=true", args.connections
+        ),
+    }
+
+    for name, latencies in results.items():
+        latencies.sort()
+        p95 = latencies[max(int(len(latencies) * 0.95) - 1, 0)]
+        print(
+            f"{name:>16}: first query median"
+            f" {statistics.median(latencies) * 1000:7.2f} ms,"
+            f" p95 {p95 * 1000:7.2f} ms"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("url", help="postgresql+asyncpgrdsiam URL")
+    parser.add_argument("--connections", type=int, default=100)
+
+    asyncio.run(_main(parser.parse_args()))
@@ -14,11 +14,20 @@ See the License for the specific language governing permissions and
 limitations under the License.
 """
 
-from typing import Any, Dict
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
 
+from sqlalchemy_rdsiam import tokens
 from sqlalchemy_rdsiam.rds import rds_client
 from sqlalchemy_rdsiam.sslrootcert import sslrootcert_path
 
+# Tokens are valid for 15 minutes. Shared tokens are only reused for a
+# shorter period, so that connections never get a token about to expire.
+_shared_token_lifetime = 600
+_shared_tokens: Dict[Tuple[Optional[str], str, int, str], Tuple[float, str]] = {}
+_shared_tokens_lock = threading.Lock()
+
 
 def build_connect_kwargs(kwargs: Dict[str, Any]) -> Dict[str, Any]:
     """Build keyword arguments for the connect functions"""
@@ -27,6 +36,7 @@ def build_connect_kwargs(kwargs: Dict[str, Any]) -> Dict[str, Any]:
     user = kwargs.get("user", "postgres")
 
     rds_sslrootcert = kwargs.get("rds_sslrootcert", "").lower() == "true"
+    rds_share_token = kwargs.get("rds_share_token", "").lower() == "true"
 
     if rds_sslrootcert:
         ssl_kwargs = {"sslrootcert": sslrootcert_path()}
@@ -36,21 +46,35 @@ def build_connect_kwargs(kwargs: Dict[str, Any]) -> Dict[str, Any]:
     # Optional region name. Otherwise, we will let `boto3`
     # pick out a default region from the environment.
     aws_region_name = kwargs.get("aws_region_name")
-    rds_clnt = rds_client(aws_region_name)
 
     # Set a password based on a RDS IAM authentication token.
     # If any password was set in`kwargs`, it will be ignored
     # and overwritten.
-    token = rds_clnt.generate_db_auth_token(
-        DBHostname=hostname,
-        Port=port,
-        DBUsername=user,
-    )
+    if rds_share_token:
+        token = _shared_token(aws_region_name, hostname, port, user)
+    else:
+        token = _generate_token(aws_region_name, hostname, port, user)
 
     token_kwargs = {"password": token}
 
     # Strip custom arguments
-    custom_args = {"aws_region_name", "create_db_if_not_exists", "rds_sslrootcert"}
+    custom_args = {
+        "aws_region_name",
+        "create_db_if_not_exists",
+        "rds_cooperative",
+        "rds_pool_autosize",
+        "rds_pool_headroom",
+        "rds_pool_processes",
+        "rds_pool_recycle",
+        "rds_pool_recycle_ahead",
+        "rds_pool_recycle_jitter",
+        "rds_pool_recycle_rate",
+        "rds_pool_refresh_seconds",
+        "rds_share_token",
+        "rds_sslrootcert",
+        "rds_type_cache",
+        "rds_type_cache_ttl",
+    }
     orig_kwargs = {k: v for k, v in kwargs.items() if k not in custom_args}
 
     return {
@@ -58,3 +82,92 @@ def build_connect_kwargs(kwargs: Dict[str, Any]) -> Dict[str, Any]:
         **ssl_kwargs,
         **token_kwargs,
     }
+
+
+def split_hosts(kwargs: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Split keyword arguments with multiple hosts into arguments for each
+    host, so that each host gets its own token.
+
+    Hosts and ports are either lists, or comma-separated strings.
+    """
+    hosts = kwargs.get("host")
+
+    if isinstance(hosts, str):
+        hosts = hosts.split(",")
+
+    if not isinstance(hosts, (list, tuple)) or len(hosts) < 2:
+        return [kwargs]
+
+    ports = kwargs.get("port", 5432)
+
+    if isinstance(ports, str):
+        ports = ports.split(",")
+    elif not isinstance(ports, (list, tuple)):
+        ports = [ports]
+
+    if len(ports) == 1:
+        ports = list(ports) * len(hosts)
+    elif len(ports) != len(hosts):
+        raise ValueError("The numbers of hosts and ports do not match")
+
+    return [
+        {**kwargs, "host": host, "port": int(port) if port else 5432}
+        for host, port in zip(hosts, ports)
+    ]
+
+
+def _generate_token(
+    aws_region_name: Optional[str], hostname: str, port: int, user: str
+) -> str:
+    rds_clnt = rds_client(aws_region_name)
+
+    return rds_clnt.generate_db_auth_token(
+        DBHostname=hostname,
+        Port=port,
+        DBUsername=user,
+    )
+
+
+def _shared_token(
+    aws_region_name: Optional[str], hostname: str, port: int, user: str
+) -> str:
+    """Get a token shared by all connections to the same instance and user."""
+    key = (aws_region_name, hostname, port, user)
+    now = time.monotonic()
+
+    with _shared_tokens_lock:
+        created_at, token = _shared_tokens.get(key, (0.0, ""))
+
+        if not token or now - created_at > _shared_token_lifetime:
+            token = _generate_token(aws_region_name, hostname, port, user)
+            _shared_tokens[key] = (now, token)
+
+    return token
+
+
+def prime_shared_tokens(
+    endpoints: Iterable[Tuple[Optional[str], str, int, str]]
+) -> None:
+    """Generate the shared tokens missing for many instances at once.
+
+    ``endpoints`` are tuples of ``(aws_region_name, host, port, user)``.
+    Tokens are generated in one batch per region.
+    """
+    now = time.monotonic()
+    by_region: Dict[Optional[str], List[Tuple[str, int, str]]] = {}
+
+    with _shared_tokens_lock:
+        for key in set(endpoints):
+            created_at, token = _shared_tokens.get(key, (0.0, ""))
+
+            if not token or now - created_at > _shared_token_lifetime:
+                by_region.setdefault(key[0], []).append(key[1:])
+
+    for aws_region_name, region_endpoints in by_region.items():
+        region_tokens = tokens.generate_db_auth_tokens(
+            region_endpoints, aws_region_name
+        )
+
+        with _shared_tokens_lock:
+            for endpoint, token in zip(region_endpoints, region_tokens):
+                _shared_tokens[(aws_region_name, *endpoint)] = (now, token)
@@ -0,0 +1,159 @@
+"""Cooperative connections for ``gevent`` and ``eventlet``.
+
+Copyright 2022 Cisco Systems, Inc.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    https://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import ipaddress
+import socket
+import sys
+from typing import Any, Callable, Dict, Optional
+
+import psycopg2
+from psycopg2 import extensions
+
+_libraries = ("gevent", "eventlet")
+
+
+def library(mode: str) -> Optional[str]:
+    """Get the library to cooperate with, given the ``rds_cooperative`` mode.
+
+    The mode is one of ``false``, ``auto`` (when the ``socket`` module is
+    monkey-patched), ``true`` (detected, or ``gevent`` if not), ``gevent``
+    and ``eventlet``.
+    """
+    mode = mode.lower()
+
+    if mode == "false":
+        return None
+
+    if mode in _libraries:
+        return mode
+
+    detected = _detect()
+
+    if mode == "auto":
+        return detected
+
+    if mode == "true":
+        return detected or "gevent"
+
+    raise ValueError(f"Invalid value for `rds_cooperative`: '{mode}'")
+
+
+def enable(library: str) -> None:
+    """Make ``psycopg2`` wait cooperatively, for all connections.
+
+    With a wait callback, ``libpq`` also establishes connections
+    asynchronously.
+    """
+    callback = _wait_callbacks[library]
+
+    if extensions.get_wait_callback() is not callback:
+        extensions.set_wait_callback(callback)
+
+
+def run_in_thread(library: str, fn: Callable, *args: Any) -> Any:
+    """Run a blocking function in a native thread, without blocking the hub."""
+    if library == "gevent":
+        import gevent
+
+        return gevent.get_hub().threadpool.apply(fn, args)
+
+    from eventlet import tpool
+
+    return tpool.execute(fn, *args)
+
+
+def resolve_hostaddr(kwargs: Dict[str, Any]) -> Dict[str, Any]:
+    """Resolve the host name, so that ``libpq`` doesn't block on DNS.
+
+    ``host`` is kept, and still used for TLS and IAM authentication. It is
+    repeated for each address, so that ``libpq`` still tries all of them in
+    turn, e.g. IPv6 then IPv4.
+    """
+    host = kwargs.get("host")
+
+    if not host or "hostaddr" in kwargs or host.startswith("/") or _is_ip(host):
+        return kwargs
+
+    # `socket` is expected to be monkey-patched, so this doesn't block
+    addrinfo = socket.getaddrinfo(host, kwargs.get("port", 5432), 0, socket.SOCK_STREAM)
+    addresses = list(dict.fromkeys(str(sockaddr[0]) for *_, sockaddr in addrinfo))
+
+    return {
+        **kwargs,
+        "host": ",".join([host] * len(addresses)),
+        "hostaddr": ",".join(addresses),
+    }
+
+
+def _detect() -> Optional[str]:
+    if "gevent" in sys.modules:
+        from gevent import monkey
+
+        if monkey.is_module_patched("socket"):
+            return "gevent"
+
+    if "eventlet" in sys.modules:
+        from eventlet import patcher
+
+        if patcher.is_monkey_patched("socket"):
+            return "eventlet"
+
+    return None
+
+
+def _is_ip(host: str) -> bool:
+    try:
+        ipaddress.ip_address(host)
+    except ValueError:
+        return False
+
+    return True
+
+
+def _gevent_wait_callback(conn: Any, timeout: Optional[float] = None) -> None:
+    from gevent.socket import wait_read, wait_write
+
+    _wait(conn, lambda fd: wait_read(fd, timeout), lambda fd: wait_write(fd, timeout))
+
+
+def _eventlet_wait_callback(conn: Any, timeout: Optional[float] = None) -> None:
+    from eventlet.hubs import trampoline
+
+    _wait(
+        conn,
+        lambda fd: trampoline(fd, read=True, timeout=timeout),
+        lambda fd: trampoline(fd, write=True, timeout=timeout),
+    )
+
+
+def _wait(conn: Any, wait_read: Callable, wait_write: Callable) -> None:
+    while True:
+        state = conn.poll()
+
+        if state == extensions.POLL_OK:
+            return
+        elif state == extensions.POLL_READ:
+            wait_read(conn.fileno())
+        elif state == extensions.POLL_WRITE:
+            wait_write(conn.fileno())
+        else:
+            raise psycopg2.OperationalError(f"Bad result from poll: {state}")
+
+
+_wait_callbacks = {
+    "gevent": _gevent_wait_callback,
+    "eventlet": _eventlet_wait_callback,
+}
@@ -16,8 +16,9 @@ See the License for the specific language governing permissions and
 limitations under the License.
 """
 
+import asyncio
 import logging
-from typing import Any, Callable, Optional
+from typing import Any, Callable, Dict, Optional
 from urllib.parse import urlencode
 
 import asyncpg
@@ -25,7 +26,8 @@ import asyncpg
 # Import the rest of the API
 from asyncpg import *  # noqa: F403,F401
 
-from sqlalchemy_rdsiam.build import build_connect_kwargs
+from sqlalchemy_rdsiam.build import build_connect_kwargs, split_hosts
+from sqlalchemy_rdsiam.type_cache import TypeCache
 
 _logger = logging.getLogger(__name__)
 _asyncpg_connect = asyncpg.connect
@@ -43,15 +45,52 @@ async def connect(
         kwargs.get("create_db_if_not_exists", "").lower() == "true"
     )
 
+    # Set by the engine if enabled, left as a string otherwise
+    type_cache = kwargs.pop("rds_type_cache", None)
+
+    if not isinstance(type_cache, TypeCache):
+        type_cache = None
+
+    hosts_kwargs = split_hosts(kwargs)
+
+    # With multiple hosts, e.g. with `target_session_attrs=read-write`, try
+    # each host in turn with its own token.
+    for host_kwargs in hosts_kwargs[:-1]:
+        try:
+            return await _connect(host_kwargs, create_db_if_not_exists, type_cache)
+
+        except (
+            OSError,
+            asyncio.TimeoutError,
+            asyncpg.PostgresError,
+            asyncpg.InterfaceError,
+            asyncpg.exceptions.TargetServerAttributeNotMatched,
+        ) as exc:
+            _logger.info(f"Could not connect to '{host_kwargs['host']}': {exc}")
+
+    return await _connect(hosts_kwargs[-1], create_db_if_not_exists, type_cache)
+
+
+async def _connect(
+    kwargs: Dict[str, Any],
+    create_db_if_not_exists: bool,
+    type_cache: Optional[TypeCache],
+) -> asyncpg.connection.Connection:
     kwargs = build_connect_kwargs(kwargs)
 
+    if type_cache is not None:
+        kwargs["connection_class"] = type_cache.connection_class(
+            kwargs.get("connection_class", asyncpg.Connection)
+        )
+
     # asyncpg's keyword arguments do not follow the PostgreSQL naming
     # as psycopg2 does. Instead, asyncpg has logic in the DSN parsing
     # code to map from a PostgreSQL DSN to the right asyncpg keyword
     # arguments. Hence, we build a DSN to leverage that logic.
 
-    # Arguments supported by `asyncpg.connect`
-    kwargs_keys = {"host", "port", "user", "password", "database"}
+    # Arguments supported by `asyncpg.connect`. The connection class is set
+    # by the type cache.
+    kwargs_keys = {"host", "port", "user", "password", "database", "connection_class"}
 
     # Arguments to pass directly to `async.connect` as keyword arguments
     direct_kwargs = {k: v for k, v in kwargs.items() if k in kwargs_keys}
@@ -16,7 +16,7 @@ limitations under the License.
 """
 import logging
 import re
-from typing import Any, Callable, Optional
+from typing import Any, Callable, Dict, Optional
 
 import psycopg2
 import sqlalchemy.exc
@@ -27,7 +27,8 @@ from psycopg2 import *  # noqa: F403,F401
 from psycopg2 import OperationalError, sql
 from psycopg2.extensions import connection
 
-from sqlalchemy_rdsiam.build import build_connect_kwargs
+from sqlalchemy_rdsiam import cooperative
+from sqlalchemy_rdsiam.build import build_connect_kwargs, split_hosts
 
 _psycopg2_connect = psycopg2.connect
 _logger = logging.getLogger(__name__)
@@ -49,8 +50,31 @@ def connect(dsn: Optional[str] = None, **kwargs: Any) -> connection:
     create_db_if_not_exists = (
         kwargs.get("create_db_if_not_exists", "").lower() == "true"
     )
-
-    kwargs = build_connect_kwargs(kwargs)
+    library = cooperative.library(kwargs.pop("rds_cooperative", "false"))
+    hosts_kwargs = split_hosts(kwargs)
+
+    # With multiple hosts, e.g. with `target_session_attrs=read-write`, try
+    # each host in turn with its own token, as libpq would.
+    for host_kwargs in hosts_kwargs[:-1]:
+        try:
+            return _connect(host_kwargs, create_db_if_not_exists, library)
+
+        except (psycopg2.OperationalError, sqlalchemy.exc.OperationalError) as exc:
+            _logger.info(f"Could not connect to '{host_kwargs['host']}': {exc}")
+
+    return _connect(hosts_kwargs[-1], create_db_if_not_exists, library)
+
+
+def _connect(
+    kwargs: Dict[str, Any], create_db_if_not_exists: bool, library: Optional[str]
+) -> connection:
+    if library is not None:
+        # Generating tokens may block on I/O, e.g. to refresh credentials.
+        cooperative.enable(library)
+        kwargs = cooperative.run_in_thread(library, build_connect_kwargs, kwargs)
+        kwargs = cooperative.resolve_hostaddr(kwargs)
+    else:
+        kwargs = build_connect_kwargs(kwargs)
 
     # 'database' is a deprecated alias still used by SQLAlchemy 1.4.
     if "database" in kwargs:
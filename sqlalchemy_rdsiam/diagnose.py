@@ -0,0 +1,401 @@
+"""Diagnose slow connections to RDS instances.
+
+Usage::
+
+    python -m sqlalchemy_rdsiam.diagnose postgresql+psycopg2rdsiam://user@host/db
+
+Copyright 2022 Cisco Systems, Inc.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    https://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import argparse
+import asyncio
+import json
+import math
+import socket
+import ssl
+import struct
+import sys
+import time
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy.engine.url import make_url
+
+from sqlalchemy_rdsiam import dialects
+from sqlalchemy_rdsiam.build import build_connect_kwargs, split_hosts
+from sqlalchemy_rdsiam.tokens import _session
+
+_drivers = {
+    "psycopg2rdsiam": (
+        dialects._has_sqlalchemy_psycopg2,
+        dialects.PGDialect_psycopg2rdsiam,
+    ),
+    "asyncpgrdsiam": (
+        dialects._has_sqlalchemy_asyncpg,
+        dialects.PGDialect_asyncpgrdsiam,
+    ),
+}
+
+_phases = ["credentials", "token", "dns", "tcp", "tls", "auth", "total"]
+
+# SigV4 signatures are rejected beyond 5 minutes of clock skew. Warn well
+# before that, since clocks keep drifting.
+_max_clock_skew = 60.0
+_max_credentials_time = 1.0
+
+# https://www.postgresql.org/docs/current/protocol-message-formats.html
+_ssl_request = struct.pack("!ii", 8, 80877103)
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m sqlalchemy_rdsiam.diagnose",
+        description="Time each step of connecting to a RDS instance.",
+    )
+    parser.add_argument("url", help="URL of the database")
+    parser.add_argument("-n", "--iterations", type=int, default=10)
+    parser.add_argument(
+        "--drivers",
+        default=",".join(d for d, (available, _) in _drivers.items() if available),
+        help="Comma-separated drivers to compare (default: all available)",
+    )
+    parser.add_argument(
+        "--sslmodes",
+        default=None,
+        help="Comma-separated `sslmode` values to compare (default: from the URL)."
+        " `rds_sslrootcert` is enabled for `verify-ca` and `verify-full`.",
+    )
+    parser.add_argument("--json", action="store_true", help="Output JSON")
+    args = parser.parse_args(argv)
+
+    drivers = args.drivers.split(",")
+    unknown_drivers = [driver for driver in drivers if driver not in _drivers]
+
+    if unknown_drivers:
+        parser.error(
+            f"unknown drivers: {', '.join(unknown_drivers)}"
+            f" (choose from {', '.join(_drivers)})"
+        )
+
+    url = make_url(args.url)
+    sslmodes: List[Optional[str]] = (
+        args.sslmodes.split(",") if args.sslmodes else [None]
+    )
+
+    runs = [
+        _run(url, driver, sslmode, args.iterations)
+        for driver in drivers
+        for sslmode in sslmodes
+    ]
+    report = {"runs": runs, "warnings": _warnings(runs)}
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(_format(report))
+
+    return 1 if any(run["errors"] for run in runs) else 0
+
+
+def _run(url: Any, driver: str, sslmode: Optional[str], iterations: int) -> Dict:
+    """Connect repeatedly, timing each step."""
+    available, dialect_cls = _drivers[driver]
+    query = dict(url.query)
+
+    if sslmode is not None:
+        query["sslmode"] = sslmode
+
+        if sslmode.startswith("verify-"):
+            query["rds_sslrootcert"] = "true"
+
+    url = _replace(url, drivername=f"postgresql+{driver}", query=query)
+    run: Dict[str, Any] = {
+        "driver": driver,
+        "sslmode": query.get("sslmode", "prefer"),
+        "rds_sslrootcert": query.get("rds_sslrootcert", "false"),
+        "iterations": iterations,
+        "errors": [],
+        "phases": {},
+        "clock_skew": None,
+        "unreachable_hosts": [],
+    }
+
+    if not available:
+        run["errors"].append(f"{driver} is not available")
+        return run
+
+    _, cparams = dialect_cls().create_connect_args(url)
+    timings: Dict[str, List[float]] = {phase: [] for phase in _phases}
+
+    for _ in range(iterations):
+        try:
+            step = _iteration(driver, cparams)
+        except Exception as exc:
+            run["errors"].append(f"{type(exc).__name__}: {exc}")
+            continue
+
+        run["clock_skew"] = step.pop("clock_skew")
+
+        for host in step.pop("unreachable_hosts"):
+            if host not in run["unreachable_hosts"]:
+                run["unreachable_hosts"].append(host)
+
+        for phase, duration in step.items():
+            if duration is not None:
+                timings[phase].append(duration)
+
+    run["phases"] = {
+        phase: _percentiles(values) for phase, values in timings.items() if values
+    }
+
+    return run
+
+
+def _iteration(driver: str, cparams: Dict[str, Any]) -> Dict[str, Any]:
+    step: Dict[str, Any] = {}
+    hosts_kwargs = split_hosts(cparams)
+
+    _, step["credentials"] = _timed(_resolve_credentials)
+    kwargs, step["token"] = _timed(lambda: build_connect_kwargs(hosts_kwargs[0]))
+
+    # With multiple hosts, connections go to the first host that answers
+    network: Dict[str, Optional[float]] = {}
+    step["unreachable_hosts"] = []
+
+    for i, host_kwargs in enumerate(hosts_kwargs):
+        host = host_kwargs.get("host", "localhost")
+        port = int(host_kwargs.get("port", 5432))
+
+        try:
+            network = _probe_network(host, port, kwargs)
+            break
+
+        except OSError:
+            if i == len(hosts_kwargs) - 1:
+                raise
+
+            step["unreachable_hosts"].append(f"{host}:{port}")
+
+    step.update(network)
+
+    # Connect with the actual DBAPI module of the dialect, which generates a
+    # token of its own. Authentication is what remains once other steps
+    # have been accounted for.
+    (local_time, server_time), step["total"] = _timed(
+        lambda: _driver_connect(driver, cparams)
+    )
+    others = step["token"] + sum(v for v in network.values() if v is not None)
+    step["auth"] = max(step["total"] - others, 0.0)
+    step["clock_skew"] = server_time - local_time
+
+    return step
+
+
+def _resolve_credentials() -> None:
+    # Refreshable credentials are refreshed when about to expire, which is
+    # timed here as well.
+    credentials = _session().get_credentials()
+
+    if credentials is None:
+        raise RuntimeError("Unable to locate AWS credentials")
+
+    credentials.get_frozen_credentials()
+
+
+def _probe_network(
+    host: str, port: int, kwargs: Dict[str, Any]
+) -> Dict[str, Optional[float]]:
+    """Time DNS resolution, and TCP and TLS connection establishment."""
+    sslmode = kwargs.get("sslmode", "prefer")
+    addrinfo, dns = _timed(
+        lambda: socket.getaddrinfo(host, port, 0, socket.SOCK_STREAM)
+    )
+    family, socktype, proto, _, sockaddr = addrinfo[0]
+
+    sock = socket.socket(family, socktype, proto)
+    tls: Optional[float] = None
+
+    try:
+        _, tcp = _timed(lambda: sock.connect(sockaddr))
+
+        if sslmode not in ("disable", "allow"):
+            start = time.perf_counter()
+            sock.sendall(_ssl_request)
+
+            if sock.recv(1) == b"S":
+                context = _ssl_context(sslmode, kwargs.get("sslrootcert"))
+                context.wrap_socket(sock, server_hostname=host).close()
+                tls = time.perf_counter() - start
+            elif sslmode != "prefer":
+                raise RuntimeError(f"Server does not support SSL (sslmode={sslmode})")
+
+    finally:
+        sock.close()
+
+    return {"dns": dns, "tcp": tcp, "tls": tls}
+
+
+def _ssl_context(sslmode: str, sslrootcert: Optional[str]) -> ssl.SSLContext:
+    if not sslmode.startswith("verify-"):
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+        context.check_hostname = False
+        context.verify_mode = ssl.CERT_NONE
+        return context
+
+    context = ssl.create_default_context(cafile=sslrootcert)
+    context.check_hostname = sslmode == "verify-full"
+
+    return context
+
+
+def _driver_connect(driver: str, cparams: Dict[str, Any]) -> Tuple[float, float]:
+    """Connect, and return the local and server times upon connection."""
+    query = "SELECT extract(epoch FROM clock_timestamp())"
+
+    if driver == "psycopg2rdsiam":
+        from sqlalchemy_rdsiam import dbapi_psycopg2
+
+        conn = dbapi_psycopg2.connect(**cparams)
+
+        try:
+            cursor = conn.cursor()
+            local_time = time.time()
+            cursor.execute(query)
+            server_time = float(cursor.fetchone()[0])
+            return (local_time + time.time()) / 2, server_time
+        finally:
+            conn.close()
+
+    async def _connect() -> Tuple[float, float]:
+        from sqlalchemy_rdsiam import dbapi_asyncpg
+
+        conn = await dbapi_asyncpg.connect(**cparams)
+
+        try:
+            local_time = time.time()
+            server_time = float(await conn.fetchval(query))
+            return (local_time + time.time()) / 2, server_time
+        finally:
+            await conn.close()
+
+    return asyncio.run(_connect())
+
+
+def _warnings(runs: List[Dict]) -> List[str]:
+    warnings = []
+
+    for run in runs:
+        name = f"{run['driver']} (sslmode={run['sslmode']})"
+        skew = run["clock_skew"]
+        credentials = run["phases"].get("credentials")
+
+        if run.get("unreachable_hosts"):
+            warnings.append(
+                f"{name}: hosts {', '.join(run['unreachable_hosts'])} could not"
+                " be reached, connections wait for them before the next host"
+            )
+
+        if skew is not None and abs(skew) > _max_clock_skew:
+            warnings.append(
+                f"{name}: clock skew of {skew:.1f}s with the server,"
+                " IAM authentication may fail"
+            )
+
+        if credentials is not None and (
+            credentials["max"] > _max_credentials_time
+            or credentials["max"] > 10 * credentials["p50"] + 0.1
+        ):
+            warnings.append(
+                f"{name}: credential resolution stalled for"
+                f" {credentials['max']:.3f}s (p50 {credentials['p50']:.3f}s)"
+            )
+
+    return warnings
+
+
+def _format(report: Dict) -> str:
+    lines = []
+
+    for run in report["runs"]:
+        lines.append(
+            f"{run['driver']} (sslmode={run['sslmode']},"
+            f" rds_sslrootcert={run['rds_sslrootcert']}),"
+            f" {run['iterations']} iterations"
+        )
+        lines.append(
+            f"  {'phase':<12}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'max ms':>10}"
+        )
+
+        for phase in _phases:
+            stats = run["phases"].get(phase)
+
+            if stats is None:
+                continue
+
+            lines.append(
+                f"  {phase:<12}"
+                + "".join(
+                    f"{stats[k] * 1000:>10.1f}" for k in ["p50", "p90", "p99", "max"]
+                )
+            )
+
+        if run["clock_skew"] is not None:
+            lines.append(f"  clock skew: {run['clock_skew']:+.3f}s")
+
+        for error in run["errors"]:
+            lines.append(f"  error: {error}")
+
+        lines.append("")
+
+    for warning in report["warnings"]:
+        lines.append(f"WARNING: {warning}")
+
+    return "\n".join(lines).rstrip()
+
+
+def _percentiles(values: List[float]) -> Dict[str, float]:
+    ordered = sorted(values)
+
+    def _nearest_rank(p: float) -> float:
+        return ordered[max(math.ceil(p * len(ordered)) - 1, 0)]
+
+    return {
+        "p50": _nearest_rank(0.5),
+        "p90": _nearest_rank(0.9),
+        "p99": _nearest_rank(0.99),
+        "max": ordered[-1],
+    }
+
+
+def _timed(fn: Callable[[], Any]) -> Tuple[Any, float]:
+    start = time.perf_counter()
+    result = fn()
+
+    return result, time.perf_counter() - start
+
+
+def _replace(url: Any, **kwargs: Any) -> Any:
+    # URLs are immutable from SQLAlchemy 1.4
+    if hasattr(url, "set"):
+        return url.set(**kwargs)
+
+    url = make_url(str(url))
+
+    for key, value in kwargs.items():
+        setattr(url, key, value)
+
+    return url
+
+
+if __name__ == "__main__":
+    sys.exit(main())
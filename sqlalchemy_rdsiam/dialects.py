@@ -15,7 +15,20 @@ See the License for the specific language governing permissions and
 limitations under the License.
 """
 from types import ModuleType
-from typing import Type
+from typing import Any, Type
+
+
+class _RDSIAMDialectMixin:
+    """Features common to all dialects."""
+
+    @classmethod
+    def engine_created(cls: Type, engine: Any) -> None:
+        from sqlalchemy_rdsiam import pool_sizing, recycling
+
+        super().engine_created(engine)  # type: ignore
+        pool_sizing.setup(engine)
+        recycling.setup(engine)
+
 
 # Dialect for `psycopg2`, when available
 try:
@@ -26,7 +39,7 @@ try:
 
     _has_sqlalchemy_psycopg2 = True
 
-    class PGDialect_psycopg2rdsiam(PGDialect_psycopg2):
+    class PGDialect_psycopg2rdsiam(_RDSIAMDialectMixin, PGDialect_psycopg2):
 
         supports_statement_cache = PGDialect_psycopg2.__dict__.get(
             "supports_statement_cache", None
@@ -70,7 +83,7 @@ try:
 
     _has_sqlalchemy_asyncpg = True
 
-    class PGDialect_asyncpgrdsiam(PGDialect_asyncpg):
+    class PGDialect_asyncpgrdsiam(_RDSIAMDialectMixin, PGDialect_asyncpg):
 
         supports_statement_cache = PGDialect_asyncpg.__dict__.get(
             "supports_statement_cache", None
@@ -88,6 +101,13 @@ try:
 
             return AsyncAdapt_asyncpg_dbapi(asyncpg=dbapi_asyncpg)
 
+        @classmethod
+        def engine_created(cls: Type, engine: Any) -> None:
+            from sqlalchemy_rdsiam import type_cache
+
+            super().engine_created(engine)
+            type_cache.setup(engine)
+
 except ImportError:
     from sqlalchemy.dialects.postgresql.base import PGDialect
 
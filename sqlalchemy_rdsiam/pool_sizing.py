@@ -0,0 +1,224 @@
+"""Size connection pools according to the ``max_connections`` of instances.
+
+Copyright 2022 Cisco Systems, Inc.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    https://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import logging
+import threading
+import time
+import weakref
+from typing import Any, NamedTuple, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.pool import QueuePool
+
+_logger = logging.getLogger(__name__)
+
+# `reserved_connections` is available from PostgreSQL 16, and
+# `rds.rds_superuser_reserved_connections` on Amazon RDS only.
+_settings_query = """
+SELECT
+    current_setting('max_connections')::int,
+    current_setting('superuser_reserved_connections')::int
+    + coalesce(current_setting('reserved_connections', true), '0')::int
+    + coalesce(
+        current_setting('rds.rds_superuser_reserved_connections', true), '0'
+    )::int
+"""
+
+_budgets: "weakref.WeakKeyDictionary[Any, _PoolSizing]" = weakref.WeakKeyDictionary()
+
+
+class PoolBudget(NamedTuple):
+    """Connection budget computed for an engine."""
+
+    max_connections: int
+    reserved_connections: int
+    processes: int
+    pool_size: int
+    max_overflow: int
+
+
+def get_budget(engine: Any) -> Optional[PoolBudget]:
+    """Get the budget last computed for an engine, if any."""
+    sizing = _budgets.get(getattr(engine, "sync_engine", engine))
+
+    return sizing.budget if sizing is not None else None
+
+
+def setup(engine: Any) -> None:
+    """Size the pool of the engine if enabled in the URL."""
+    query = engine.url.query
+
+    if query.get("rds_pool_autosize", "").lower() != "true":
+        return
+
+    if not isinstance(engine.pool, QueuePool):
+        _logger.warning(
+            f"Pool sizing is only supported for `QueuePool`, not"
+            f" `{type(engine.pool).__name__}`"
+        )
+        return
+
+    sizing = _PoolSizing(
+        engine,
+        processes=int(query.get("rds_pool_processes", 1)),
+        headroom=float(query.get("rds_pool_headroom", 0.1)),
+        refresh_seconds=float(query.get("rds_pool_refresh_seconds", 300)),
+        pool_size=engine.pool.size(),
+        max_overflow=engine.pool._max_overflow,
+    )
+    _budgets[engine] = sizing
+
+    # Listeners on the engine are kept when the pool is recreated
+    event.listen(engine, "connect", sizing.on_connect)
+    event.listen(engine, "checkout", sizing.on_checkout)
+
+
+def compute_limits(
+    max_connections: int,
+    reserved_connections: int,
+    processes: int,
+    headroom: float,
+    pool_size: int,
+    max_overflow: int,
+) -> Tuple[int, int]:
+    """Split the connections available to one engine between the pool size
+    and the overflow, keeping the configured ratio.
+    """
+    available = (max_connections - reserved_connections) * (1 - headroom)
+    limit = max(int(available // processes), 1)
+
+    if max_overflow < 0:
+        # Unlimited overflow cannot be kept
+        max_overflow = 0
+
+    if pool_size + max_overflow == 0:
+        # Unlimited pool size cannot be kept either, nor any ratio
+        return limit, 0
+
+    new_pool_size = max(round(limit * pool_size / (pool_size + max_overflow)), 1)
+
+    return new_pool_size, max(limit - new_pool_size, 0)
+
+
+class _PoolSizing:
+    def __init__(
+        self,
+        engine: Any,
+        processes: int,
+        headroom: float,
+        refresh_seconds: float,
+        pool_size: int,
+        max_overflow: int,
+    ) -> None:
+        self._engine = weakref.ref(engine)
+        self.processes = processes
+        self.headroom = headroom
+        self.refresh_seconds = refresh_seconds
+        self.pool_size = pool_size
+        self.max_overflow = max_overflow
+
+        self.budget: Optional[PoolBudget] = None
+        self._evaluated_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def on_connect(self, dbapi_connection: Any, connection_record: Any) -> None:
+        self._maybe_evaluate(dbapi_connection)
+
+    def on_checkout(
+        self, dbapi_connection: Any, connection_record: Any, connection_proxy: Any
+    ) -> None:
+        self._maybe_evaluate(dbapi_connection)
+
+    def _maybe_evaluate(self, dbapi_connection: Any) -> None:
+        now = time.monotonic()
+
+        # Only one connection evaluates at a time, others go on
+        if not self._lock.acquire(blocking=False):
+            return
+
+        try:
+            if (
+                self._evaluated_at is not None
+                and now - self._evaluated_at < self.refresh_seconds
+            ):
+                return
+
+            self._evaluated_at = now
+            self._evaluate(dbapi_connection)
+
+        except Exception:
+            _logger.exception("Failed to size the pool")
+
+        finally:
+            self._lock.release()
+
+    def _evaluate(self, dbapi_connection: Any) -> None:
+        cursor = dbapi_connection.cursor()
+
+        try:
+            cursor.execute(_settings_query)
+            max_connections, reserved_connections = cursor.fetchone()
+        finally:
+            cursor.close()
+
+        # Do not leave a transaction open on the connection
+        dbapi_connection.rollback()
+
+        pool_size, max_overflow = compute_limits(
+            max_connections,
+            reserved_connections,
+            self.processes,
+            self.headroom,
+            self.pool_size,
+            self.max_overflow,
+        )
+        budget = PoolBudget(
+            max_connections=max_connections,
+            reserved_connections=reserved_connections,
+            processes=self.processes,
+            pool_size=pool_size,
+            max_overflow=max_overflow,
+        )
+
+        if budget != self.budget:
+            _logger.info(f"Sizing pool: {budget}")
+
+        self.budget = budget
+
+        engine = self._engine()
+
+        if engine is not None:
+            _resize(engine.pool, pool_size, max_overflow)
+
+
+def _resize(pool: QueuePool, pool_size: int, max_overflow: int) -> None:
+    # `QueuePool` has no public API to resize it. Connections in excess
+    # are closed when returned to the pool.
+    queue = pool._pool
+
+    # The overflow counts connections beyond the pool size, starting from
+    # `-pool_size`, so it moves along with the size.
+    with pool._overflow_lock:
+        pool._overflow -= pool_size - queue.maxsize
+        queue.maxsize = pool_size
+
+        # `AsyncAdaptedQueuePool` creates its `asyncio` queue lazily
+        async_queue = queue.__dict__.get("_queue")
+
+        if async_queue is not None:
+            async_queue._maxsize = pool_size
+
+        pool._max_overflow = max_overflow
@@ -0,0 +1,210 @@
+"""Recycle pooled connections at jittered times, at a bounded rate.
+
+Copyright 2022 Cisco Systems, Inc.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    https://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import logging
+import os
+import random
+import threading
+import time
+import weakref
+from typing import Any, Dict, Optional
+
+from sqlalchemy import event, exc
+
+_logger = logging.getLogger(__name__)
+
+_info_key = "rds_recycle_at"
+
+
+def setup(engine: Any) -> None:
+    """Recycle connections of the engine if enabled in the URL."""
+    query = engine.url.query
+
+    if "rds_pool_recycle" not in query:
+        return
+
+    recycle = float(query["rds_pool_recycle"])
+    jitter = float(query.get("rds_pool_recycle_jitter", 0.2))
+    policy = RecyclePolicy(
+        engine,
+        recycle=recycle,
+        jitter=jitter,
+        ahead=float(query.get("rds_pool_recycle_ahead", recycle * (1 - jitter) / 10)),
+        max_rate=float(query.get("rds_pool_recycle_rate", 1.0)),
+    )
+
+    # Listeners on the engine are kept when the pool is recreated
+    event.listen(engine, "connect", policy.on_connect)
+    event.listen(engine, "checkout", policy.on_checkout)
+    event.listen(engine, "checkin", policy.on_checkin)
+    event.listen(engine, "close", policy.on_close)
+
+
+class RecyclePolicy:
+    """Recycle each connection after a random lifetime.
+
+    Lifetimes are drawn between ``recycle * (1 - jitter)`` and ``recycle``
+    seconds, so that connections opened together are not recycled together.
+    Connections are recycled upon checkout once expired. For pools which are
+    not asynchronous, idle connections expiring within ``ahead`` seconds are
+    also recycled in a background thread. Overall, at most ``max_rate``
+    connections are recycled per second, and the others are postponed.
+    """
+
+    def __init__(
+        self,
+        engine: Any,
+        recycle: float,
+        jitter: float,
+        ahead: float,
+        max_rate: float,
+    ) -> None:
+        if ahead >= recycle * (1 - jitter):
+            raise ValueError(
+                "Connections cannot be recycled ahead of time by more than"
+                " their shortest lifetime"
+            )
+
+        self._engine = weakref.ref(engine)
+        self.recycle = recycle
+        self.jitter = jitter
+        self.ahead = ahead
+        self.max_rate = max_rate
+
+        self._lock = threading.Lock()
+        self._last_recycle = float("-inf")
+
+        # Deadlines of checked-in connections, by connection record
+        self._idle: Dict[int, float] = {}
+
+        self._local = threading.local()
+        self._thread: Optional[threading.Thread] = None
+        self._thread_pid: Optional[int] = None
+
+    def lifetime(self) -> float:
+        return self.recycle * (1 - self.jitter * random.random())
+
+    def acquire(self) -> bool:
+        """Check whether a connection may be recycled now, given the rate."""
+        now = time.monotonic()
+
+        with self._lock:
+            if now - self._last_recycle < 1 / self.max_rate:
+                return False
+
+            self._last_recycle = now
+            return True
+
+    def on_connect(self, dbapi_connection: Any, connection_record: Any) -> None:
+        connection_record.info[_info_key] = time.monotonic() + self.lifetime()
+
+    def on_checkout(
+        self, dbapi_connection: Any, connection_record: Any, connection_proxy: Any
+    ) -> None:
+        self._idle.pop(id(connection_record), None)
+
+        deadline = connection_record.info.get(_info_key)
+        ahead = self.ahead if getattr(self._local, "background", False) else 0.0
+        now = time.monotonic()
+
+        if deadline is None or now + ahead < deadline:
+            return
+
+        if not self.acquire():
+            if deadline <= now:
+                # Postpone, spreading postponed connections over time
+                connection_record.info[_info_key] = (
+                    now + random.random() / self.max_rate
+                )
+            return
+
+        # The pool reconnects upon disconnection errors during checkout
+        raise exc.DisconnectionError("Recycling connection")
+
+    def on_checkin(self, dbapi_connection: Any, connection_record: Any) -> None:
+        deadline = connection_record.info.get(_info_key)
+
+        if dbapi_connection is None or deadline is None:
+            return
+
+        self._idle[id(connection_record)] = deadline
+        self._ensure_thread()
+
+    def on_close(self, dbapi_connection: Any, connection_record: Any) -> None:
+        # Overflow connections are closed upon checkin, and idle connections
+        # when the pool is disposed of.
+        self._idle.pop(id(connection_record), None)
+
+    def recycle_idle(self) -> None:
+        """Recycle idle connections about to expire, through checkouts."""
+        engine = self._engine()
+
+        if engine is None:
+            return
+
+        pool = engine.pool
+        now = time.monotonic()
+        due = sum(1 for d in list(self._idle.values()) if d - now < self.ahead)
+
+        self._local.background = True
+
+        try:
+            # Check out as many connections as are idle at most, so that
+            # connections are not created for the sake of recycling.
+            for _ in range(min(due, pool.checkedin())):
+                pool.connect().close()
+
+        finally:
+            self._local.background = False
+
+    def _ensure_thread(self) -> None:
+        engine = self._engine()
+
+        if engine is None or getattr(engine.pool, "_is_asyncio", False):
+            return
+
+        # Threads do not survive forks
+        if self._thread is not None and self._thread_pid == os.getpid():
+            return
+
+        with self._lock:
+            if self._thread is not None and self._thread_pid == os.getpid():
+                return
+
+            self._thread_pid = os.getpid()
+            self._thread = threading.Thread(
+                target=_run, args=(weakref.ref(self),), daemon=True
+            )
+            self._thread.start()
+
+
+def _run(policy_ref: "weakref.ref[RecyclePolicy]") -> None:
+    while True:
+        policy = policy_ref()
+
+        if policy is None or policy._engine() is None:
+            return
+
+        interval = max(min(policy.ahead / 2, 1 / policy.max_rate), 0.1)
+
+        try:
+            policy.recycle_idle()
+        except Exception:
+            _logger.exception("Failed to recycle idle connections")
+
+        # Do not keep the policy alive while sleeping
+        del policy
+        time.sleep(interval)
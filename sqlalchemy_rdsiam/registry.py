@@ -0,0 +1,326 @@
+"""Registry of engines for database-per-tenant deployments.
+
+Copyright 2022 Cisco Systems, Inc.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    https://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, NoReturn, Optional, Tuple
+
+import sqlalchemy
+from sqlalchemy.engine.url import make_url
+
+_logger = logging.getLogger(__name__)
+
+
+class _Entry:
+    def __init__(self, engine: Any, instance: Tuple[str, int]) -> None:
+        self.engine = engine
+        self.instance = instance
+        self.last_used = time.monotonic()
+
+
+class _EngineCache:
+    """Engines created upon demand by name, sharing IAM authentication
+    tokens for the same instance and user.
+    """
+
+    def __init__(self, create_engine_fn: Callable, engine_kwargs: Dict) -> None:
+        self._create_engine_fn = create_engine_fn
+        self._engine_kwargs = engine_kwargs
+
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._is_async: Optional[bool] = None
+        self._lock = threading.Lock()
+
+    def remove(self, name: str) -> None:
+        """Dispose of an engine, if any."""
+        for engine in self._pop([name], is_async=False):
+            engine.dispose()
+
+    async def aremove(self, name: str) -> None:
+        """Dispose of an asynchronous engine, if any."""
+        for engine in self._pop([name], is_async=True):
+            await engine.dispose()
+
+    def dispose(self) -> None:
+        """Dispose of all engines."""
+        for engine in self._pop(None, is_async=False):
+            engine.dispose()
+
+    async def adispose(self) -> None:
+        """Dispose of all asynchronous engines."""
+        for engine in self._pop(None, is_async=True):
+            await engine.dispose()
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _create_engine(self, url: Any, is_async: Optional[bool], **kwargs: Any) -> Any:
+        """Create an engine, which must be asynchronous if ``is_async`` is
+        true, or synchronous if it is false. Must be called with the lock held.
+        """
+        connect_args = {
+            **self._engine_kwargs.get("connect_args", {}),
+            "rds_share_token": "true",
+        }
+        engine = self._create_engine_fn(
+            url, **{**self._engine_kwargs, **kwargs, "connect_args": connect_args}
+        )
+
+        if is_async is not None and _is_async(engine) != is_async:
+            # The engine has no connections yet, so this does not need to
+            # run in the event loop
+            getattr(engine, "sync_engine", engine).dispose()
+            _raise_async_error(_is_async(engine))
+
+        # All engines are either synchronous or asynchronous
+        self._is_async = _is_async(engine)
+
+        return engine
+
+    def _pop(self, names: Optional[List[str]], is_async: bool) -> List[Any]:
+        with self._lock:
+            self._check_async(is_async)
+
+            if names is None:
+                names = list(self._entries)
+
+            entries = [self._entries.pop(n) for n in names if n in self._entries]
+
+        return [entry.engine for entry in entries]
+
+    def _check_async(self, is_async: bool) -> None:
+        if self._is_async is not None and self._is_async != is_async:
+            _raise_async_error(self._is_async)
+
+
+class EngineRegistry(_EngineCache):
+    """Cache of engines, one per tenant, bounded per instance.
+
+    ``url_for_tenant`` returns the URL of the database of a tenant.
+    Each engine may open up to ``pool_size + max_overflow`` connections.
+    Least recently used engines are disposed of, so that all engines to the
+    same instance never open more than ``max_connections_per_instance``,
+    and so that there are never more than ``max_engines`` engines. Engines
+    with connections checked out are not disposed of; if no other engine
+    can be, ``RuntimeError`` is raised.
+
+    Engines share IAM authentication tokens for the same instance and user.
+
+    Use ``create_engine_fn=sqlalchemy.ext.asyncio.create_async_engine`` for
+    asynchronous engines, along with ``aget``, ``aremove`` and
+    ``adispose``.
+    """
+
+    def __init__(
+        self,
+        url_for_tenant: Callable[[str], Any],
+        max_connections_per_instance: int,
+        pool_size: int = 2,
+        max_overflow: int = 0,
+        max_engines: Optional[int] = None,
+        idle_timeout: Optional[float] = None,
+        create_engine_fn: Callable = sqlalchemy.create_engine,
+        **engine_kwargs: Any,
+    ) -> None:
+        if max_overflow < 0 or pool_size + max_overflow < 1:
+            # A pool size of 0 would mean no limit to `QueuePool`
+            raise ValueError(
+                "`max_overflow` must not be negative, and `pool_size + "
+                "max_overflow` must be at least 1"
+            )
+
+        if pool_size + max_overflow > max_connections_per_instance:
+            raise ValueError(
+                "`pool_size + max_overflow` must not be greater than "
+                "`max_connections_per_instance`"
+            )
+
+        super().__init__(create_engine_fn, engine_kwargs)
+
+        self._url_for_tenant = url_for_tenant
+        self._max_connections_per_instance = max_connections_per_instance
+        self._pool_size = pool_size
+        self._max_overflow = max_overflow
+        self._max_engines = max_engines
+        self._idle_timeout = idle_timeout
+
+    def get(self, tenant: str) -> Any:
+        """Get the engine of a tenant, creating it if needed.
+
+        Use ``aget`` with asynchronous engines.
+        """
+        engine, evicted = self._get(tenant, is_async=False)
+
+        for evicted_engine in evicted:
+            evicted_engine.dispose()
+
+        return engine
+
+    async def aget(self, tenant: str) -> Any:
+        """Get the asynchronous engine of a tenant, creating it if needed."""
+        engine, evicted = self._get(tenant, is_async=True)
+
+        for evicted_engine in evicted:
+            await evicted_engine.dispose()
+
+        return engine
+
+    def connection_budget(self) -> Dict[Tuple[str, int], int]:
+        """Maximum number of connections that engines may open per instance."""
+        budget: Dict[Tuple[str, int], int] = {}
+
+        with self._lock:
+            for entry in self._entries.values():
+                budget[entry.instance] = (
+                    budget.get(entry.instance, 0) + self._engine_connections
+                )
+
+        return budget
+
+    def _get(self, tenant: str, is_async: bool) -> Tuple[Any, List[Any]]:
+        """Get the engine of a tenant, along with the engines evicted to make
+        room for it, which the caller disposes of.
+        """
+        with self._lock:
+            self._check_async(is_async)
+
+            # Nothing is evicted unless the engine can be returned, so that
+            # no engine is lost without being disposed of
+            expired = self._expired_tenants()
+            entry = self._entries.get(tenant)
+
+            if entry is not None and tenant not in expired:
+                entry.last_used = time.monotonic()
+                self._entries.move_to_end(tenant)
+                return entry.engine, self._evict(expired)
+
+            url = make_url(self._url_for_tenant(tenant))
+            instance = _instance(url)
+            evicted = self._make_room(instance, expired)
+
+            _logger.info(f"Creating engine for tenant '{tenant}'")
+            engine = self._create_engine(
+                url,
+                is_async,
+                pool_size=self._pool_size,
+                max_overflow=self._max_overflow,
+            )
+            evicted_engines = self._evict(expired + evicted)
+            self._entries[tenant] = _Entry(engine, instance)
+
+            return engine, evicted_engines
+
+    @property
+    def _engine_connections(self) -> int:
+        return self._pool_size + self._max_overflow
+
+    def _make_room(self, instance: Tuple[str, int], expired: List[str]) -> List[str]:
+        """Choose engines to evict, besides the ``expired`` ones, so that a new
+        engine to the instance can be added. Engines with connections checked
+        out are kept, since they would go on using connections that are no
+        longer accounted for.
+        """
+        instance_tenants = [
+            tenant
+            for tenant, entry in self._entries.items()
+            if entry.instance == instance and tenant not in expired
+        ]
+        max_instance_engines = (
+            self._max_connections_per_instance // self._engine_connections
+        )
+
+        # Entries are ordered from least to most recently used
+        excess = len(instance_tenants) - max_instance_engines + 1
+        evicted = self._idle_tenants(instance_tenants, excess)
+
+        if len(evicted) < excess:
+            raise RuntimeError(
+                f"Engines to instance '{instance[0]}:{instance[1]}' all have"
+                " connections checked out"
+            )
+
+        if self._max_engines is not None:
+            remaining = [
+                t for t in self._entries if t not in expired and t not in evicted
+            ]
+            excess = len(remaining) - self._max_engines + 1
+            idle = self._idle_tenants(remaining, excess)
+
+            if len(idle) < excess:
+                raise RuntimeError("Engines all have connections checked out")
+
+            evicted += idle
+
+        return evicted
+
+    def _idle_tenants(self, tenants: List[str], count: int) -> List[str]:
+        """Get up to ``count`` tenants whose engines have no connections
+        checked out.
+        """
+        idle = [t for t in tenants if not _is_busy(self._entries[t].engine)]
+
+        return idle[: max(count, 0)]
+
+    def _expired_tenants(self) -> List[str]:
+        """Get the tenants whose engines have been idle for too long."""
+        if self._idle_timeout is None:
+            return []
+
+        now = time.monotonic()
+
+        return [
+            tenant
+            for tenant, entry in self._entries.items()
+            if now - entry.last_used > self._idle_timeout and not _is_busy(entry.engine)
+        ]
+
+    def _evict(self, tenants: List[str]) -> List[Any]:
+        engines = []
+
+        for tenant in tenants:
+            _logger.info(f"Evicting engine for tenant '{tenant}'")
+            engines.append(self._entries.pop(tenant).engine)
+
+        return engines
+
+
+def _is_async(engine: Any) -> bool:
+    return hasattr(engine, "sync_engine")
+
+
+def _instance(url: Any) -> Tuple[str, int]:
+    return (url.host or "localhost", url.port or 5432)
+
+
+def _raise_async_error(is_async: bool) -> NoReturn:
+    if is_async:
+        raise TypeError(
+            "Use `aget`, `aremove` and `adispose` with asynchronous engines"
+        )
+
+    raise TypeError("Use `get`, `remove` and `dispose` with synchronous engines")
+
+
+def _is_busy(engine: Any) -> bool:
+    pool = getattr(engine, "sync_engine", engine).pool
+    checkedout = getattr(pool, "checkedout", None)
+
+    return checkedout is not None and checkedout() > 0
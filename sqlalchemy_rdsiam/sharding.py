@@ -0,0 +1,315 @@
+"""Route shard keys to engines of many instances.
+
+Copyright 2022 Cisco Systems, Inc.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    https://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import asyncio
+import bisect
+import hashlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+import sqlalchemy
+from sqlalchemy.engine.url import make_url
+
+from sqlalchemy_rdsiam import build
+from sqlalchemy_rdsiam.registry import _EngineCache, _Entry, _instance
+
+_logger = logging.getLogger(__name__)
+
+
+def _hash(value: Any) -> int:
+    # `hash()` is salted per process, so it cannot place keys consistently
+    digest = hashlib.blake2b(str(value).encode(), digest_size=8).digest()
+
+    return int.from_bytes(digest, "big")
+
+
+class HashRing:
+    """Consistent hashing of keys onto shards.
+
+    Each shard is placed at ``replicas`` points of a ring, and keys go to
+    the next point. Adding a shard only moves keys to that shard, about
+    ``1 / len(shards)`` of them.
+    """
+
+    def __init__(self, shards: Iterable[str] = (), replicas: int = 128) -> None:
+        self.replicas = replicas
+
+        self._points: List[int] = []
+        self._shards: Dict[int, str] = {}
+        self._lock = threading.Lock()
+
+        for shard in shards:
+            self.add(shard)
+
+    @property
+    def shards(self) -> List[str]:
+        return sorted(set(self._shards.values()))
+
+    def add(self, shard: str) -> None:
+        with self._lock:
+            for i in range(self.replicas):
+                point = _hash(f"{shard}#{i}")
+
+                # Collisions are unlikely, but must not depend on order
+                if point in self._shards:
+                    self._shards[point] = min(self._shards[point], shard)
+                    continue
+
+                bisect.insort(self._points, point)
+                self._shards[point] = shard
+
+    def remove(self, shard: str) -> None:
+        with self._lock:
+            for point in [p for p, s in self._shards.items() if s == shard]:
+                del self._shards[point]
+                self._points.remove(point)
+
+    def get(self, key: Any) -> str:
+        """Get the shard of a key."""
+        with self._lock:
+            if not self._points:
+                raise LookupError("There are no shards")
+
+            i = bisect.bisect(self._points, _hash(key)) % len(self._points)
+
+            return self._shards[self._points[i]]
+
+
+class RangeMap:
+    """Ranges of keys mapped onto shards.
+
+    Each shard holds the keys from its lower bound, included, up to the
+    next lower bound. Adding a shard splits one range, and only moves keys
+    of that range.
+    """
+
+    def __init__(self, ranges: Iterable[Tuple[Any, str]] = ()) -> None:
+        self._bounds: List[Any] = []
+        self._shards: List[str] = []
+        self._lock = threading.Lock()
+
+        for lower_bound, shard in ranges:
+            self.add(lower_bound, shard)
+
+    @property
+    def shards(self) -> List[str]:
+        return sorted(set(self._shards))
+
+    def add(self, lower_bound: Any, shard: str) -> None:
+        with self._lock:
+            i = bisect.bisect_left(self._bounds, lower_bound)
+
+            if i < len(self._bounds) and self._bounds[i] == lower_bound:
+                self._shards[i] = shard
+            else:
+                self._bounds.insert(i, lower_bound)
+                self._shards.insert(i, shard)
+
+    def remove(self, lower_bound: Any) -> None:
+        """Remove a range, merging its keys into the previous range."""
+        with self._lock:
+            i = bisect.bisect_left(self._bounds, lower_bound)
+
+            if i == len(self._bounds) or self._bounds[i] != lower_bound:
+                raise KeyError(lower_bound)
+
+            del self._bounds[i]
+            del self._shards[i]
+
+    def get(self, key: Any) -> str:
+        """Get the shard of a key."""
+        with self._lock:
+            i = bisect.bisect_right(self._bounds, key) - 1
+
+            if i < 0:
+                raise LookupError(f"No shard holds key {key!r}")
+
+            return self._shards[i]
+
+
+class ShardRouter(_EngineCache):
+    """Engines of shards, and the routing of keys to them.
+
+    ``shard_map`` maps keys to shards, e.g. a ``HashRing`` or a
+    ``RangeMap``, and ``url_for_shard`` returns the URL of a shard. Engines
+    are created upon first use, and share IAM authentication tokens per
+    instance and user. When fanning out to shards without engines, their
+    tokens are generated in one batch per region.
+
+    Removing a shard from the map does not dispose of its engine, use
+    ``remove``.
+
+    Use ``create_engine_fn=sqlalchemy.ext.asyncio.create_async_engine`` for
+    asynchronous engines, along with ``fan_out_async``, ``aremove`` and
+    ``adispose``.
+    """
+
+    def __init__(
+        self,
+        shard_map: Any,
+        url_for_shard: Callable[[str], Any],
+        max_workers: Optional[int] = None,
+        create_engine_fn: Callable = sqlalchemy.create_engine,
+        **engine_kwargs: Any,
+    ) -> None:
+        super().__init__(create_engine_fn, engine_kwargs)
+
+        self.shard_map = shard_map
+
+        self._url_for_shard = url_for_shard
+        self._max_workers = max_workers
+
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def get(self, key: Any) -> Any:
+        """Get the engine of the shard of a key."""
+        return self.engine(self.shard_map.get(key))
+
+    def engine(self, shard: str) -> Any:
+        """Get the engine of a shard, creating it if needed."""
+        with self._lock:
+            entry = self._entries.get(shard)
+
+            if entry is not None:
+                return entry.engine
+
+            _logger.info(f"Creating engine for shard '{shard}'")
+            url = make_url(self._url_for_shard(shard))
+            engine = self._create_engine(url, None)
+            self._entries[shard] = _Entry(engine, _instance(url))
+
+            return engine
+
+    def fan_out(
+        self, fn: Callable[[Any], Any], shards: Optional[Iterable[str]] = None
+    ) -> Dict[str, Any]:
+        """Call ``fn`` with the engine of each shard concurrently, in a
+        thread pool, and return the results by shard.
+
+        All shards of the map are used by default. The first exception
+        raised by ``fn``, if any, is raised once all calls are done.
+        """
+        shards = self._shards(shards)
+        new_shards = self._new_shards(shards)
+
+        if new_shards:
+            self._prime_tokens(new_shards)
+
+        engines = {shard: self.engine(shard) for shard in shards}
+
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self._max_workers,
+                    thread_name_prefix="sqlalchemy_rdsiam_shard",
+                )
+
+            executor = self._executor
+
+        futures = {
+            shard: executor.submit(fn, engine) for shard, engine in engines.items()
+        }
+
+        # Wait for all calls before raising, so that none outlives the fan-out
+        for future in futures.values():
+            future.exception()
+
+        return {shard: future.result() for shard, future in futures.items()}
+
+    async def fan_out_async(
+        self,
+        fn: Callable[[Any], Awaitable[Any]],
+        shards: Optional[Iterable[str]] = None,
+    ) -> Dict[str, Any]:
+        """Await ``fn`` with the engine of each shard concurrently, and
+        return the results by shard.
+
+        All shards of the map are used by default. The first exception
+        raised by ``fn``, if any, is raised once all calls are done.
+        """
+        shards = self._shards(shards)
+        new_shards = self._new_shards(shards)
+
+        # Token generation blocks, so it must not run in the event loop
+        if new_shards:
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(None, self._prime_tokens, new_shards)
+
+        engines = {shard: self.engine(shard) for shard in shards}
+
+        # Wait for all calls before raising, so that none outlives the fan-out
+        results = await asyncio.gather(
+            *(fn(engine) for engine in engines.values()), return_exceptions=True
+        )
+
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+
+        return dict(zip(engines, results))
+
+    def dispose(self) -> None:
+        """Dispose of all engines, and of the thread pool."""
+        super().dispose()
+        self._shutdown_executor()
+
+    async def adispose(self) -> None:
+        """Dispose of all asynchronous engines, and of the thread pool."""
+        await super().adispose()
+        self._shutdown_executor()
+
+    def _shutdown_executor(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+
+        if executor is not None:
+            executor.shutdown(wait=False)
+
+    def _shards(self, shards: Optional[Iterable[str]]) -> List[str]:
+        return list(self.shard_map.shards if shards is None else shards)
+
+    def _new_shards(self, shards: List[str]) -> List[str]:
+        with self._lock:
+            return [shard for shard in shards if shard not in self._entries]
+
+    def _prime_tokens(self, shards: List[str]) -> None:
+        endpoints: List[Tuple[Optional[str], str, int, str]] = []
+
+        for shard in shards:
+            url = make_url(self._url_for_shard(shard))
+            aws_region_name = url.query.get("aws_region_name")
+
+            # Multiple hosts are left to connections
+            if url.host is None or "host" in url.query:
+                continue
+
+            endpoints.append(
+                (
+                    aws_region_name if isinstance(aws_region_name, str) else None,
+                    url.host,
+                    url.port or 5432,
+                    url.username or "postgres",
+                )
+            )
+
+        try:
+            build.prime_shared_tokens(endpoints)
+
+        except Exception:
+            # Connections generate their own tokens otherwise
+            _logger.exception("Failed to generate tokens for shards")
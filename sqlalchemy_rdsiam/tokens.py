@@ -0,0 +1,138 @@
+"""Generation of RDS IAM authentication tokens in batches.
+
+Copyright 2022 Cisco Systems, Inc.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    https://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import datetime
+import functools
+import hashlib
+import hmac
+from typing import Any, Iterable, List, Optional, Tuple
+from urllib.parse import quote
+
+import boto3
+
+# Tokens are presigned URLs, following AWS Signature Version 4:
+# https://docs.aws.amazon.com/IAM/latest/UserGuide/create-signed-request.html
+_algorithm = "AWS4-HMAC-SHA256"
+_service = "rds-db"
+_expires = 900
+_empty_payload_hash = hashlib.sha256(b"").hexdigest()
+
+
+@functools.lru_cache()
+def _session() -> Any:
+    return boto3.session.Session()
+
+
+def generate_db_auth_tokens(
+    endpoints: Iterable[Tuple[str, int, str]], region_name: Optional[str] = None
+) -> List[str]:
+    """Generate RDS IAM authentication tokens for many instances.
+
+    ``endpoints`` are tuples of ``(host, port, user)``. The tokens are the
+    same as the ones of ``generate_db_auth_token`` from ``boto3``, but
+    credentials are only resolved once, and the signing key is reused across
+    all instances of the region.
+    """
+    session = _session()
+    region = region_name or session.region_name
+
+    if region is None:
+        raise ValueError("An AWS region is required to generate tokens")
+
+    credentials = session.get_credentials()
+
+    if credentials is None:
+        raise ValueError("Unable to locate AWS credentials")
+
+    frozen = credentials.get_frozen_credentials()
+    now = datetime.datetime.now(datetime.timezone.utc)
+
+    return [
+        _presign(host, port, user, region, frozen, now)
+        for host, port, user in endpoints
+    ]
+
+
+def generate_db_auth_token(
+    host: str, port: int, user: str, region_name: Optional[str] = None
+) -> str:
+    """Generate a RDS IAM authentication token for one instance."""
+    return generate_db_auth_tokens([(host, port, user)], region_name)[0]
+
+
+@functools.lru_cache(maxsize=128)
+def _signing_key(secret_key: str, datestamp: str, region: str) -> bytes:
+    """Derive the signing key, which is valid for a whole day."""
+    key = _hmac(f"AWS4{secret_key}".encode(), datestamp)
+    key = _hmac(key, region)
+    key = _hmac(key, _service)
+
+    return _hmac(key, "aws4_request")
+
+
+def _presign(
+    host: str,
+    port: int,
+    user: str,
+    region: str,
+    credentials: Any,
+    now: datetime.datetime,
+) -> str:
+    amz_date = now.strftime("%Y%m%dT%H%M%SZ")
+    datestamp = now.strftime("%Y%m%d")
+    scope = f"{datestamp}/{region}/{_service}/aws4_request"
+
+    params = {
+        "Action": "connect",
+        "DBUser": user,
+        "X-Amz-Algorithm": _algorithm,
+        "X-Amz-Credential": f"{credentials.access_key}/{scope}",
+        "X-Amz-Date": amz_date,
+        "X-Amz-Expires": str(_expires),
+        "X-Amz-SignedHeaders": "host",
+    }
+
+    if credentials.token:
+        params["X-Amz-Security-Token"] = credentials.token
+
+    query = "&".join(f"{_quote(k)}={_quote(v)}" for k, v in sorted(params.items()))
+    netloc = f"{host.lower()}:{port}"
+
+    canonical_request = "\n".join(
+        ["GET", "/", query, f"host:{netloc}", "", "host", _empty_payload_hash]
+    )
+    string_to_sign = "\n".join(
+        [
+            _algorithm,
+            amz_date,
+            scope,
+            hashlib.sha256(canonical_request.encode()).hexdigest(),
+        ]
+    )
+
+    key = _signing_key(credentials.secret_key, datestamp, region)
+    signature = hmac.new(key, string_to_sign.encode(), hashlib.sha256).hexdigest()
+
+    return f"{host}:{port}/?{query}&X-Amz-Signature={signature}"
+
+
+def _hmac(key: bytes, msg: str) -> bytes:
+    return hmac.new(key, msg.encode(), hashlib.sha256).digest()
+
+
+def _quote(value: str) -> str:
+    return quote(value, safe="-_.~")
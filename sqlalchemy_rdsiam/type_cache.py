@@ -0,0 +1,183 @@
+"""Share type introspection across ``asyncpg`` connections of an engine.
+
+Copyright 2022 Cisco Systems, Inc.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    https://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import logging
+import threading
+import time
+import weakref
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple, Type
+
+import asyncpg
+from sqlalchemy import event
+
+_logger = logging.getLogger(__name__)
+
+_caches: "weakref.WeakKeyDictionary[Any, TypeCache]" = weakref.WeakKeyDictionary()
+
+
+def get_cache(engine: Any) -> Optional["TypeCache"]:
+    """Get the type cache of an engine, if enabled."""
+    return _caches.get(getattr(engine, "sync_engine", engine))
+
+
+def setup(engine: Any) -> None:
+    """Share type introspection across connections if enabled in the URL."""
+    query = engine.url.query
+
+    if query.get("rds_type_cache", "").lower() != "true":
+        return
+
+    cache = TypeCache(ttl=float(query.get("rds_type_cache_ttl", 300)))
+    _caches[engine] = cache
+
+    event.listen(engine, "do_connect", cache.on_do_connect)
+
+
+class _Introspection:
+    """Stands for the statement of an introspection served from the cache.
+
+    ``asyncpg`` prepares statements again after introspecting types with an
+    unnamed statement. No statement is run here, so it has a name.
+    """
+
+    name = "rds_type_cache"
+
+
+class TypeCache:
+    """Type records introspected by the connections of one engine.
+
+    When a connection meets types it has no codecs for, it gets their
+    records from the cache instead of querying the catalog. The cache is
+    cleared when ``asyncpg`` detects schema changes, when records queried
+    again differ from cached ones, and after ``ttl`` seconds, so that
+    changes made by other processes are picked up.
+    """
+
+    def __init__(self, ttl: float) -> None:
+        self.ttl = ttl
+
+        self._lock = threading.Lock()
+        self._classes: Dict[Type, Type] = {}
+        self._clear()
+
+    def _clear(self) -> None:
+        # Records by OID, in the order they were introspected, so that
+        # types come after the types they depend on.
+        self._types: Dict[int, Any] = {}
+        self._types_by_name: Dict[Tuple[str, str], Any] = {}
+        self._expires_at = time.monotonic() + self.ttl
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._clear()
+
+    def connection_class(self, base: Type = asyncpg.Connection) -> Type:
+        """Get a subclass of the connection class using the cache."""
+        with self._lock:
+            if base not in self._classes:
+                self._classes[base] = type(
+                    f"TypeCached{base.__name__}",
+                    (_TypeCachedConnection, base),
+                    {"_type_cache": self},
+                )
+
+            return self._classes[base]
+
+    def on_do_connect(
+        self, dialect: Any, conn_rec: Any, cargs: Any, cparams: Dict[str, Any]
+    ) -> None:
+        cparams["rds_type_cache"] = self
+
+    def get_types(self, typeoids: Iterable[int]) -> Optional[List[Any]]:
+        """Get all records if those of the types are cached, or None."""
+        with self._lock:
+            self._expire()
+
+            if not all(oid in self._types for oid in typeoids):
+                return None
+
+            return list(self._types.values())
+
+    def add_types(self, types: Iterable[Any]) -> None:
+        types = list(types)
+
+        with self._lock:
+            self._expire()
+
+            if any(self._types.get(ti["oid"], ti) != ti for ti in types):
+                _logger.info("Invalidating type cache after a schema change")
+                self._clear()
+
+            for ti in types:
+                self._types.setdefault(ti["oid"], ti)
+
+    def get_type(self, typename: str, schema: str) -> Optional[Any]:
+        with self._lock:
+            self._expire()
+
+            return self._types_by_name.get((typename, schema))
+
+    def add_type(self, typename: str, schema: str, ti: Any) -> None:
+        with self._lock:
+            self._expire()
+            self._types_by_name[typename, schema] = ti
+
+    def _expire(self) -> None:
+        if time.monotonic() >= self._expires_at:
+            self._clear()
+
+
+class _TypeCachedConnection:
+    """Mixin for ``asyncpg`` connections using a type cache."""
+
+    _type_cache: TypeCache
+
+    async def _introspect_types(self, typeoids: Any, timeout: Any) -> Any:
+        served: Set[int] = self.__dict__.setdefault("_rds_served_types", set())
+        typeoids = list(typeoids)
+
+        # Types served before are asked for again when their codecs were
+        # dropped, or when the cached records did not resolve them. Query
+        # the catalog then, to find out.
+        if not served.intersection(typeoids):
+            types = self._type_cache.get_types(typeoids)
+
+            if types is not None:
+                served.update(typeoids)
+                return types, _Introspection()
+
+        types, intro_stmt = await super()._introspect_types(  # type: ignore
+            typeoids, timeout
+        )
+        served.difference_update(typeoids)
+        self._type_cache.add_types(types)
+
+        return types, intro_stmt
+
+    async def _introspect_type(self, typename: str, schema: str) -> Any:
+        ti = self._type_cache.get_type(typename, schema)
+
+        if ti is None:
+            ti = await super()._introspect_type(typename, schema)  # type: ignore
+            self._type_cache.add_type(typename, schema, ti)
+
+        return ti
+
+    def _drop_local_type_cache(self) -> None:
+        # The schema changed, e.g. upon `OutdatedSchemaCacheError`
+        super()._drop_local_type_cache()  # type: ignore
+        self._type_cache.invalidate()
+        self.__dict__.pop("_rds_served_types", None)
@@ -0,0 +1,148 @@
+"""
+Copyright 2022 Cisco Systems, Inc.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    https://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import socket
+import subprocess
+import sys
+import textwrap
+from unittest.mock import patch
+
+import pytest
+
+from sqlalchemy_rdsiam.dialects import _has_sqlalchemy_psycopg2
+
+try:
+    import gevent  # noqa
+except ImportError:
+    _has_gevent = False
+else:
+    _has_gevent = True
+
+pytestmark = pytest.mark.skipif(
+    not _has_sqlalchemy_psycopg2, reason="psycopg2 is not supported"
+)
+
+# Monkey-patching cannot be undone, so run under gevent in a subprocess.
+# A greenlet ticks while connecting: it must keep running, even though token
+# generation blocks the native thread.
+_gevent_script = """
+from gevent import monkey
+
+monkey.patch_all()
+
+import sys
+
+import gevent
+
+import sqlalchemy_rdsiam.build
+from sqlalchemy_rdsiam import cooperative, dbapi_psycopg2
+
+blocking_sleep = monkey.get_original("time", "sleep")
+ticks = []
+
+
+def _ticker():
+    while True:
+        ticks.append(1)
+        gevent.sleep(0.01)
+
+
+def _generate_token(*args):
+    blocking_sleep(0.3)
+    return sys.argv[1]
+
+
+sqlalchemy_rdsiam.build._generate_token = _generate_token
+assert cooperative.library("auto") == "gevent"
+
+ticker = gevent.spawn(_ticker)
+gevent.sleep(0)
+
+if len(sys.argv) > 2:
+    conn = dbapi_psycopg2.connect(
+        host=sys.argv[2],
+        port=int(sys.argv[3]),
+        user=sys.argv[4],
+        dbname=sys.argv[5],
+        rds_cooperative="auto",
+    )
+    conn.cursor().execute("SELECT pg_sleep(0.2)")
+    conn.close()
+else:
+    cooperative.run_in_thread(
+        "gevent", sqlalchemy_rdsiam.build.build_connect_kwargs, {}
+    )
+
+ticker.kill()
+assert len(ticks) >= 10, len(ticks)
+"""
+
+
+def test_library():
+    from sqlalchemy_rdsiam import cooperative
+
+    assert cooperative.library("false") is None
+    assert cooperative.library("eventlet") == "eventlet"
+
+    with pytest.raises(ValueError):
+        cooperative.library("sometimes")
+
+
+def test_resolve_hostaddr():
+    """Check that all addresses are passed, for `libpq` to try them in turn."""
+    from sqlalchemy_rdsiam import cooperative
+
+    addrinfo = [
+        (socket.AF_INET6, socket.SOCK_STREAM, 6, "", ("2001:db8::1", 5432, 0, 0)),
+        (socket.AF_INET, socket.SOCK_STREAM, 6, "", ("192.0.2.1", 5432)),
+        (socket.AF_INET, socket.SOCK_STREAM, 6, "", ("192.0.2.1", 5432)),
+    ]
+
+    with patch("socket.getaddrinfo", return_value=addrinfo):
+        kwargs = cooperative.resolve_hostaddr({"host": "host", "port": 5432})
+
+    assert kwargs == {
+        "host": "host,host",
+        "hostaddr": "2001:db8::1,192.0.2.1",
+        "port": 5432,
+    }
+
+    assert cooperative.resolve_hostaddr({"host": "192.0.2.1"}) == {"host": "192.0.2.1"}
+
+
+@pytest.mark.skipif(not _has_gevent, reason="gevent is not installed")
+def test_run_in_thread_gevent():
+    """Check that token generation doesn't block the hub."""
+    _run_gevent_script(["password"])
+
+
+@pytest.mark.skipif(not _has_gevent, reason="gevent is not installed")
+def test_connect_gevent(pg_instance):
+    """Check that connecting and querying don't block the hub."""
+    _run_gevent_script(
+        [
+            pg_instance.password,
+            pg_instance.host,
+            str(pg_instance.port),
+            pg_instance.user,
+            f"{pg_instance.dbname}_tmpl",
+        ]
+    )
+
+
+def _run_gevent_script(args):
+    subprocess.run(
+        [sys.executable, "-c", textwrap.dedent(_gevent_script), *args], check=True
+    )
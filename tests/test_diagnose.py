@@ -0,0 +1,112 @@
+"""
+Copyright 2022 Cisco Systems, Inc.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    https://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import json
+from unittest.mock import patch
+
+import pytest
+
+from sqlalchemy_rdsiam import diagnose
+from sqlalchemy_rdsiam.tokens import _session
+
+
+def test_percentiles():
+    stats = diagnose._percentiles([float(i) for i in range(1, 101)])
+
+    assert stats == {"p50": 50.0, "p90": 90.0, "p99": 99.0, "max": 100.0}
+    assert diagnose._percentiles([3.0])["p50"] == 3.0
+
+
+def test_warnings():
+    """Check that clock skew and credential stalls are flagged."""
+    run = {
+        "driver": "psycopg2rdsiam",
+        "sslmode": "prefer",
+        "clock_skew": 0.5,
+        "phases": {"credentials": {"p50": 0.001, "max": 0.002}},
+    }
+    assert diagnose._warnings([run]) == []
+
+    skewed = {**run, "clock_skew": -120.0}
+    stalled = {**run, "phases": {"credentials": {"p50": 0.001, "max": 2.0}}}
+    unreachable = {**run, "unreachable_hosts": ["down:5432"]}
+    warnings = diagnose._warnings([skewed, stalled, unreachable])
+
+    assert len(warnings) == 3
+    assert "clock skew" in warnings[0]
+    assert "stalled" in warnings[1]
+    assert "down:5432" in warnings[2]
+
+
+def test_iteration_multihost(mock_boto_client):
+    """Check that hosts are probed in turn."""
+    probed = []
+
+    def _probe_network(host, port, kwargs):
+        probed.append((host, port))
+
+        if host == "down":
+            raise ConnectionRefusedError()
+
+        return {"dns": 0.001, "tcp": 0.002, "tls": None}
+
+    with patch.object(diagnose, "_probe_network", _probe_network), patch.object(
+        diagnose, "_driver_connect", return_value=(100.0, 100.5)
+    ), patch.object(diagnose, "_session") as session:
+        step = diagnose._iteration(
+            "psycopg2rdsiam", {"host": "down,up", "port": "5432,5433", "user": "u"}
+        )
+
+    assert probed == [("down", 5432), ("up", 5433)]
+    assert step["unreachable_hosts"] == ["down:5432"]
+    assert step["clock_skew"] == 0.5
+    session().get_credentials().get_frozen_credentials.assert_called()
+    mock_boto_client.generate_db_auth_token.assert_called_once_with(
+        DBHostname="down", Port=5432, DBUsername="u"
+    )
+
+
+def test_unknown_drivers(capsys):
+    with pytest.raises(SystemExit):
+        diagnose.main(
+            ["postgresql+psycopg2rdsiam://user@host/db", "--drivers", "psycopg2"]
+        )
+
+    assert "unknown drivers: psycopg2" in capsys.readouterr().err
+
+
+def test_diagnose(mock_boto_client, pg_instance, monkeypatch, capsys):
+    """Check that connections to an instance are timed."""
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "AKIDEXAMPLE")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "secret")
+    _session.cache_clear()
+
+    url = (
+        "postgresql+psycopg2rdsiam://"
+        f"{pg_instance.user}:@{pg_instance.host}:{pg_instance.port}"
+        f"/{pg_instance.dbname}_tmpl"
+    )
+
+    assert diagnose.main([url, "--iterations", "3", "--json"]) == 0
+
+    report = json.loads(capsys.readouterr().out)
+
+    assert report["runs"]
+    for run in report["runs"]:
+        assert run["errors"] == []
+        assert {"credentials", "token", "dns", "tcp", "auth", "total"} <= set(
+            run["phases"]
+        )
+        assert abs(run["clock_skew"]) < 5
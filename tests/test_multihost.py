@@ -0,0 +1,179 @@
+"""
+Copyright 2022 Cisco Systems, Inc.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    https://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import asyncio
+from unittest.mock import AsyncMock, call, patch
+
+import pytest
+import sqlalchemy
+
+from sqlalchemy_rdsiam.build import split_hosts
+from sqlalchemy_rdsiam.dialects import _has_sqlalchemy_asyncpg, _has_sqlalchemy_psycopg2
+
+_has_sqlalchemy_multihost = int(sqlalchemy.__version__.split(".")[0]) >= 2
+
+
+@pytest.mark.parametrize(
+    "kwargs,expected",
+    [
+        ({"host": "a"}, [("a", None)]),
+        ({"host": "a", "port": 5433}, [("a", 5433)]),
+        ({"host": "a,b"}, [("a", 5432), ("b", 5432)]),
+        ({"host": "a,b", "port": "5433"}, [("a", 5433), ("b", 5433)]),
+        ({"host": "a,b", "port": "5433,"}, [("a", 5433), ("b", 5432)]),
+        ({"host": ["a", "b"], "port": [5433, 5434]}, [("a", 5433), ("b", 5434)]),
+    ],
+)
+def test_split_hosts(kwargs, expected):
+    hosts_kwargs = split_hosts({**kwargs, "user": "user"})
+
+    assert [(kw["host"], kw.get("port")) for kw in hosts_kwargs] == expected
+    assert all(kw["user"] == "user" for kw in hosts_kwargs)
+
+
+def test_split_hosts_mismatch():
+    with pytest.raises(ValueError):
+        split_hosts({"host": "a,b,c", "port": "1,2"})
+
+
+@pytest.mark.skipif(not _has_sqlalchemy_psycopg2, reason="psycopg2 is not supported")
+def test_connect_psycopg2(mock_boto_client):
+    """Check that each host is tried in turn with its own token."""
+    import psycopg2
+
+    from sqlalchemy_rdsiam import dbapi_psycopg2
+
+    mock_boto_client.generate_db_auth_token.side_effect = lambda **kw: kw["DBHostname"]
+    conn = object()
+
+    with patch(
+        "sqlalchemy_rdsiam.dbapi_psycopg2._psycopg2_connect",
+        side_effect=[psycopg2.OperationalError("read-only"), conn],
+    ) as connect_fn:
+        assert (
+            dbapi_psycopg2.connect(
+                host="reader,writer",
+                port="5432,5433",
+                user="user",
+                target_session_attrs="read-write",
+            )
+            is conn
+        )
+
+    assert [c.kwargs["password"] for c in connect_fn.call_args_list] == [
+        "reader",
+        "writer",
+    ]
+    assert [c.kwargs["port"] for c in connect_fn.call_args_list] == [5432, 5433]
+    assert all(
+        c.kwargs["target_session_attrs"] == "read-write"
+        for c in connect_fn.call_args_list
+    )
+    mock_boto_client.generate_db_auth_token.assert_has_calls(
+        [
+            call(DBHostname="reader", Port=5432, DBUsername="user"),
+            call(DBHostname="writer", Port=5433, DBUsername="user"),
+        ]
+    )
+
+
+@pytest.mark.skipif(not _has_sqlalchemy_asyncpg, reason="asyncpg is not supported")
+def test_connect_asyncpg(mock_boto_client):
+    """Check that each host is tried in turn with its own token."""
+    import asyncpg
+
+    from sqlalchemy_rdsiam import dbapi_asyncpg
+
+    mock_boto_client.generate_db_auth_token.side_effect = lambda **kw: kw["DBHostname"]
+    conn = object()
+
+    with patch(
+        "sqlalchemy_rdsiam.dbapi_asyncpg._asyncpg_connect",
+        AsyncMock(
+            side_effect=[
+                asyncpg.exceptions.TargetServerAttributeNotMatched("standby"),
+                conn,
+            ]
+        ),
+    ) as connect_fn:
+        assert (
+            asyncio.run(
+                dbapi_asyncpg.connect(
+                    host=["reader", "writer"],
+                    port=[5432, 5433],
+                    user="user",
+                    target_session_attrs="read-write",
+                )
+            )
+            is conn
+        )
+
+    assert [c.kwargs["password"] for c in connect_fn.call_args_list] == [
+        "reader",
+        "writer",
+    ]
+    assert all(
+        "target_session_attrs=read-write" in c.kwargs["dsn"]
+        for c in connect_fn.call_args_list
+    )
+
+
+@pytest.mark.skipif(
+    not _has_sqlalchemy_multihost, reason="multiple host URLs are not supported"
+)
+@pytest.mark.parametrize(
+    "try_connect_fn,engine_prefix",
+    [
+        pytest.param(
+            "try_connect_sync",
+            "postgresql+psycopg2rdsiam",
+            marks=pytest.mark.skipif(
+                not _has_sqlalchemy_psycopg2, reason="psycopg2 is not supported"
+            ),
+        ),
+        pytest.param(
+            "try_connect_async",
+            "postgresql+asyncpgrdsiam",
+            marks=pytest.mark.skipif(
+                not _has_sqlalchemy_asyncpg, reason="asyncpg is not supported"
+            ),
+        ),
+    ],
+)
+def test_connect_multihost(
+    request, mock_boto_client, pg_instance, try_connect_fn, engine_prefix
+):
+    """Check that we connect to the first writable host."""
+    try_connect = request.getfixturevalue(try_connect_fn)
+
+    # Nothing listens on the first host
+    url = (
+        f"{engine_prefix}://{pg_instance.user}:@/{pg_instance.dbname}_tmpl"
+        f"?host=127.0.0.1:1&host={pg_instance.host}:{pg_instance.port}"
+        "&target_session_attrs=read-write"
+    )
+
+    try_connect(url)
+
+    mock_boto_client.generate_db_auth_token.assert_has_calls(
+        [
+            call(DBHostname="127.0.0.1", Port=1, DBUsername=pg_instance.user),
+            call(
+                DBHostname=pg_instance.host,
+                Port=pg_instance.port,
+                DBUsername=pg_instance.user,
+            ),
+        ]
+    )
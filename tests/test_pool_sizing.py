@@ -0,0 +1,138 @@
+"""
+Copyright 2022 Cisco Systems, Inc.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    https://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+from unittest.mock import MagicMock
+
+import pytest
+import sqlalchemy
+
+from sqlalchemy_rdsiam import pool_sizing
+from sqlalchemy_rdsiam.dialects import _has_sqlalchemy_psycopg2
+
+pytestmark = pytest.mark.skipif(
+    not _has_sqlalchemy_psycopg2, reason="psycopg2 is not supported"
+)
+
+
+@pytest.mark.parametrize(
+    "settings,pool,expected",
+    [
+        # 90% of 100 connections, for 3 processes
+        ((103, 3, 3, 0.1), (5, 10), (10, 20)),
+        ((103, 3, 3, 0.1), (5, 0), (30, 0)),
+        # Unlimited overflow
+        ((103, 3, 3, 0.1), (5, -1), (30, 0)),
+        # Unlimited pool size, without a ratio to keep
+        ((103, 3, 3, 0.1), (0, 0), (30, 0)),
+        ((103, 3, 3, 0.1), (0, -1), (30, 0)),
+        ((103, 3, 3, 0.1), (0, 10), (1, 29)),
+        # Always at least one connection
+        ((10, 3, 100, 0.1), (5, 10), (1, 0)),
+    ],
+)
+def test_compute_limits(settings, pool, expected):
+    assert pool_sizing.compute_limits(*settings, *pool) == expected
+
+
+def test_resize():
+    """Check that the pool is resized from the server settings."""
+    engine = sqlalchemy.create_engine(
+        "postgresql+psycopg2rdsiam://user@host/db"
+        "?rds_pool_autosize=true&rds_pool_processes=4&rds_pool_headroom=0",
+        pool_size=5,
+        max_overflow=5,
+    )
+
+    assert pool_sizing.get_budget(engine) is None
+
+    dbapi_connection = MagicMock()
+    dbapi_connection.cursor.return_value.fetchone.return_value = (85, 5)
+    pool_sizing._budgets[engine]._maybe_evaluate(dbapi_connection)
+
+    assert pool_sizing.get_budget(engine) == pool_sizing.PoolBudget(
+        max_connections=85,
+        reserved_connections=5,
+        processes=4,
+        pool_size=10,
+        max_overflow=10,
+    )
+    assert engine.pool.size() == 10
+    assert engine.pool._max_overflow == 10
+
+    # Not evaluated again until the refresh period is over
+    dbapi_connection.cursor.return_value.fetchone.return_value = (45, 5)
+    pool_sizing._budgets[engine]._maybe_evaluate(dbapi_connection)
+    assert engine.pool.size() == 10
+
+    # Still resized after recreating the pool
+    engine.dispose()
+    assert engine.pool.size() == 10
+
+
+def test_disabled():
+    engine = sqlalchemy.create_engine("postgresql+psycopg2rdsiam://user@host/db")
+
+    assert engine not in pool_sizing._budgets
+    assert pool_sizing.get_budget(engine) is None
+
+
+def test_connect(mock_boto_client, pg_instance):
+    """Check that the budget is computed upon connecting."""
+    url = (
+        "postgresql+psycopg2rdsiam://"
+        f"{pg_instance.user}:@{pg_instance.host}:{pg_instance.port}"
+        f"/{pg_instance.dbname}_tmpl?rds_pool_autosize=true"
+    )
+    engine = sqlalchemy.create_engine(url)
+
+    with engine.connect() as conn:
+        max_connections = int(
+            conn.execute(sqlalchemy.text("SHOW max_connections")).scalar()
+        )
+
+    budget = pool_sizing.get_budget(engine)
+
+    assert budget is not None
+    assert budget.max_connections == max_connections
+    assert engine.pool.size() == budget.pool_size
+
+
+@pytest.mark.parametrize(
+    "before,after",
+    [
+        ((10, 10), (1, 0)),
+        ((5, 5), (10, 10)),
+    ],
+)
+def test_resize_limit(before, after):
+    """Check that the pool opens as many connections as the new limits."""
+    pool = sqlalchemy.pool.QueuePool(
+        MagicMock, pool_size=before[0], max_overflow=before[1], timeout=0.01
+    )
+
+    # With a connection checked out while resizing
+    conns = [pool.connect()]
+    pool_sizing._resize(pool, *after)
+
+    with pytest.raises(sqlalchemy.exc.TimeoutError):
+        while True:
+            conns.append(pool.connect())
+
+    assert len(conns) == sum(after)
+
+    for conn in conns:
+        conn.close()
+
+    assert pool.checkedin() == after[0]
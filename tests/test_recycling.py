@@ -0,0 +1,157 @@
+"""
+Copyright 2022 Cisco Systems, Inc.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    https://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import sqlite3
+import time
+
+import pytest
+import sqlalchemy
+from sqlalchemy.pool import QueuePool
+
+from sqlalchemy_rdsiam import recycling
+
+
+@pytest.fixture
+def make_engine():
+    """Engine to SQLite, with a recycle policy."""
+
+    def _make_engine(pool_size=5, max_overflow=10, **policy_kwargs):
+        engine = sqlalchemy.create_engine(
+            "sqlite://",
+            poolclass=QueuePool,
+            pool_size=pool_size,
+            max_overflow=max_overflow,
+            creator=lambda: sqlite3.connect(":memory:", check_same_thread=False),
+        )
+        policy = recycling.RecyclePolicy(engine, **policy_kwargs)
+        sqlalchemy.event.listen(engine, "connect", policy.on_connect)
+        sqlalchemy.event.listen(engine, "checkout", policy.on_checkout)
+        sqlalchemy.event.listen(engine, "checkin", policy.on_checkin)
+        sqlalchemy.event.listen(engine, "close", policy.on_close)
+
+        connects = []
+        sqlalchemy.event.listen(engine, "connect", lambda *args: connects.append(1))
+
+        return engine, policy, connects
+
+    return _make_engine
+
+
+def test_lifetime():
+    """Check that lifetimes are spread over the jitter window."""
+    policy = recycling.RecyclePolicy(
+        sqlalchemy.create_engine("sqlite://"),
+        recycle=100.0,
+        jitter=0.2,
+        ahead=0.0,
+        max_rate=1.0,
+    )
+    lifetimes = [policy.lifetime() for _ in range(1000)]
+
+    assert all(80.0 <= lifetime <= 100.0 for lifetime in lifetimes)
+    assert max(lifetimes) - min(lifetimes) > 15.0
+
+
+def test_recycle_on_checkout(make_engine):
+    engine, _, connects = make_engine(
+        recycle=0.1, jitter=0.5, ahead=0.0, max_rate=1000.0
+    )
+
+    with engine.connect():
+        pass
+
+    with engine.connect():
+        pass
+
+    assert len(connects) == 1
+
+    time.sleep(0.15)
+
+    with engine.connect():
+        pass
+
+    assert len(connects) == 2
+
+
+def test_max_rate(make_engine):
+    """Check that expired connections are postponed beyond the rate."""
+    engine, _, connects = make_engine(recycle=0.1, jitter=0.0, ahead=0.0, max_rate=1.0)
+
+    conn_1 = engine.connect()
+    conn_2 = engine.connect()
+    conn_1.close()
+    conn_2.close()
+
+    time.sleep(0.15)
+
+    conn_1 = engine.connect()
+    conn_2 = engine.connect()
+
+    # Only one of both connections has been recycled
+    assert len(connects) == 3
+
+
+def test_recycle_idle(make_engine):
+    """Check that idle connections are recycled in the background."""
+    engine, policy, connects = make_engine(
+        recycle=1.0, jitter=0.0, ahead=0.5, max_rate=1000.0
+    )
+
+    with engine.connect():
+        pass
+
+    assert len(connects) == 1
+
+    # Recycled in the background ahead of time, without any checkout
+    time.sleep(0.8)
+
+    assert len(connects) == 2
+
+
+def test_closed_connections(make_engine):
+    """Check that closed connections are no longer tracked as idle."""
+    engine, policy, connects = make_engine(
+        pool_size=1, max_overflow=1, recycle=10.0, jitter=0.0, ahead=1.0, max_rate=1.0
+    )
+
+    conn_1 = engine.connect()
+    conn_2 = engine.connect()
+    conn_1.close()
+
+    # The overflow connection is closed upon checkin
+    conn_2.close()
+
+    assert len(connects) == 2
+    assert len(policy._idle) == 1
+
+    engine.dispose()
+
+    assert len(policy._idle) == 0
+
+
+def test_setup_from_url():
+    engine = sqlalchemy.create_engine(
+        "postgresql+psycopg2rdsiam://user@host/db?rds_pool_recycle=600"
+    )
+
+    (listener,) = engine.pool.dispatch.checkout
+    assert isinstance(listener.__self__, recycling.RecyclePolicy)
+    assert listener.__self__.recycle == 600.0
+
+    with pytest.raises(ValueError):
+        sqlalchemy.create_engine(
+            "postgresql+psycopg2rdsiam://user@host/db"
+            "?rds_pool_recycle=600&rds_pool_recycle_ahead=600"
+        )
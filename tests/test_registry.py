@@ -0,0 +1,225 @@
+"""
+Copyright 2022 Cisco Systems, Inc.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    https://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import asyncio
+import time
+
+import pytest
+import sqlalchemy
+from sqlalchemy.pool import QueuePool
+
+from sqlalchemy_rdsiam import build
+from sqlalchemy_rdsiam.dialects import _has_sqlalchemy_asyncpg, _has_sqlalchemy_psycopg2
+from sqlalchemy_rdsiam.registry import EngineRegistry
+
+
+def _url_for_tenant(tenant: str) -> str:
+    host = tenant.split("-")[0]
+    return f"postgresql+psycopg2rdsiam://user@{host}:5432/{tenant}"
+
+
+@pytest.mark.skipif(not _has_sqlalchemy_psycopg2, reason="psycopg2 is not supported")
+def test_evict_per_instance():
+    """Check that least recently used engines are evicted per instance."""
+    registry = EngineRegistry(
+        _url_for_tenant, max_connections_per_instance=5, pool_size=2
+    )
+
+    engine_a1 = registry.get("a-1")
+    registry.get("a-2")
+    registry.get("b-1")
+
+    assert registry.get("a-1") is engine_a1
+    assert registry.connection_budget() == {("a", 5432): 4, ("b", 5432): 2}
+
+    # "a-2" is the least recently used engine to instance "a"
+    registry.get("a-3")
+
+    assert "a-2" not in registry
+    assert all(tenant in registry for tenant in ["a-1", "a-3", "b-1"])
+    assert registry.connection_budget() == {("a", 5432): 4, ("b", 5432): 2}
+
+    registry.dispose()
+    assert len(registry) == 0
+
+
+@pytest.mark.skipif(not _has_sqlalchemy_psycopg2, reason="psycopg2 is not supported")
+def test_evict_max_engines():
+    """Check that the number of engines is bounded."""
+    registry = EngineRegistry(
+        _url_for_tenant, max_connections_per_instance=100, max_engines=2
+    )
+
+    for tenant in ["a-1", "b-1", "c-1"]:
+        engine = registry.get(tenant)
+
+    assert len(registry) == 2
+    assert "a-1" not in registry
+    assert engine.pool.size() == 2
+
+
+def test_share_token(mock_boto_client):
+    """Check that tokens are shared for the same instance and user."""
+    build._shared_tokens.clear()
+
+    for database in ["tenant-1", "tenant-2"]:
+        kwargs = build.build_connect_kwargs(
+            {
+                "host": "host",
+                "port": 5432,
+                "user": "user",
+                "database": database,
+                "rds_share_token": "true",
+            }
+        )
+
+        assert "rds_share_token" not in kwargs
+        assert kwargs["password"] is not None
+
+    assert mock_boto_client.generate_db_auth_token.call_count == 1
+
+    build.build_connect_kwargs({"host": "other-host", "rds_share_token": "true"})
+    assert mock_boto_client.generate_db_auth_token.call_count == 2
+
+
+def _create_sqlite_engine(url, pool_size, max_overflow, **kwargs):
+    return sqlalchemy.create_engine(
+        "sqlite://",
+        poolclass=QueuePool,
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+    )
+
+
+def test_keep_busy_engines():
+    """Check that engines with connections checked out are not evicted."""
+    registry = EngineRegistry(
+        _url_for_tenant,
+        max_connections_per_instance=2,
+        pool_size=1,
+        create_engine_fn=_create_sqlite_engine,
+    )
+
+    conn = registry.get("a-1").connect()
+    registry.get("a-2")
+
+    # "a-2" is evicted instead of "a-1", even though used more recently
+    registry.get("a-3")
+
+    assert "a-1" in registry
+    assert "a-2" not in registry
+
+    conn_3 = registry.get("a-3").connect()
+
+    with pytest.raises(RuntimeError):
+        registry.get("a-4")
+
+    conn.close()
+    registry.get("a-4")
+    conn_3.close()
+
+    assert "a-1" not in registry
+    registry.dispose()
+
+
+def test_keep_engines_on_error():
+    """Check that idle engines are not evicted when the new engine cannot be
+    created, so that none is lost without being disposed of.
+    """
+    registry = EngineRegistry(
+        _url_for_tenant,
+        max_connections_per_instance=2,
+        pool_size=1,
+        idle_timeout=0.05,
+        create_engine_fn=_create_sqlite_engine,
+    )
+
+    engine_b1 = registry.get("b-1")
+    engine_b1.connect().close()
+    pool_b1 = engine_b1.pool
+
+    conns = [registry.get(tenant).connect() for tenant in ["a-1", "a-2"]]
+    time.sleep(0.1)
+
+    with pytest.raises(RuntimeError):
+        registry.get("a-3")
+
+    assert "b-1" in registry
+    assert engine_b1.pool is pool_b1
+    assert pool_b1.checkedin() == 1
+
+    for conn in conns:
+        conn.close()
+
+    # Idle engines are evicted along with the new one
+    registry.get("a-3")
+
+    assert "b-1" not in registry
+    assert engine_b1.pool is not pool_b1
+    registry.dispose()
+
+
+@pytest.mark.parametrize("pool_size, max_overflow", [(0, 0), (2, -1), (0, -1)], ids=str)
+def test_invalid_pool_size(pool_size, max_overflow):
+    with pytest.raises(ValueError):
+        EngineRegistry(
+            _url_for_tenant,
+            max_connections_per_instance=10,
+            pool_size=pool_size,
+            max_overflow=max_overflow,
+        )
+
+
+@pytest.mark.skipif(not _has_sqlalchemy_asyncpg, reason="asyncpg is not supported")
+def test_async_engines():
+    """Check that asynchronous engines are disposed of in the event loop."""
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    registry = EngineRegistry(
+        lambda tenant: f"postgresql+asyncpgrdsiam://user@host/{tenant}",
+        max_connections_per_instance=2,
+        pool_size=2,
+        create_engine_fn=create_async_engine,
+    )
+
+    async def _test():
+        engine_1 = await registry.aget("tenant-1")
+        pool_1 = engine_1.sync_engine.pool
+
+        with pytest.raises(TypeError):
+            registry.get("tenant-1")
+
+        await registry.aget("tenant-2")
+
+        # The pool is recreated when the engine is disposed of
+        assert "tenant-1" not in registry
+        assert engine_1.sync_engine.pool is not pool_1
+
+        await registry.adispose()
+        assert len(registry) == 0
+
+    asyncio.run(_test())
+
+    # Synchronous methods cannot create asynchronous engines either
+    registry = EngineRegistry(
+        lambda tenant: f"postgresql+asyncpgrdsiam://user@host/{tenant}",
+        max_connections_per_instance=2,
+        create_engine_fn=create_async_engine,
+    )
+
+    with pytest.raises(TypeError):
+        registry.get("tenant-1")
+
+    assert len(registry) == 0
@@ -0,0 +1,198 @@
+"""
+Copyright 2022 Cisco Systems, Inc.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    https://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import asyncio
+import threading
+from unittest.mock import patch
+
+import pytest
+
+from sqlalchemy_rdsiam import build
+from sqlalchemy_rdsiam.dialects import _has_sqlalchemy_asyncpg, _has_sqlalchemy_psycopg2
+from sqlalchemy_rdsiam.sharding import HashRing, RangeMap, ShardRouter
+
+
+def _url_for_shard(shard: str) -> str:
+    return (
+        f"postgresql+psycopg2rdsiam://user@{shard}:5432/db"
+        f"?aws_region_name={'us-west-2' if shard == 'd' else 'us-east-2'}"
+    )
+
+
+def test_hash_ring():
+    """Check that adding a shard only moves keys to that shard."""
+    ring = HashRing(["a", "b", "c", "d"])
+    keys = range(10000)
+    before = {key: ring.get(key) for key in keys}
+
+    assert set(before.values()) == {"a", "b", "c", "d"}
+
+    # Placement does not depend on the process, nor on the order of shards
+    assert before == {key: HashRing(["d", "c", "b", "a"]).get(key) for key in keys}
+
+    ring.add("e")
+    moved = [key for key in keys if ring.get(key) != before[key]]
+
+    assert all(ring.get(key) == "e" for key in moved)
+    assert 0.1 < len(moved) / len(keys) < 0.3
+
+    ring.remove("e")
+    assert {key: ring.get(key) for key in keys} == before
+    assert ring.shards == ["a", "b", "c", "d"]
+
+    with pytest.raises(LookupError):
+        HashRing().get("key")
+
+
+def test_range_map():
+    """Check that adding a shard only moves keys of the split range."""
+    ranges = RangeMap([(0, "a"), (100, "b"), (200, "a")])
+
+    assert [ranges.get(key) for key in [0, 99, 100, 199, 200, 10**6]] == [
+        "a",
+        "a",
+        "b",
+        "b",
+        "a",
+        "a",
+    ]
+    assert ranges.shards == ["a", "b"]
+
+    ranges.add(150, "c")
+    assert [ranges.get(key) for key in [0, 149, 150, 199, 200]] == [
+        "a",
+        "b",
+        "c",
+        "c",
+        "a",
+    ]
+
+    ranges.remove(150)
+    assert ranges.get(150) == "b"
+
+    with pytest.raises(LookupError):
+        ranges.get(-1)
+
+    with pytest.raises(KeyError):
+        ranges.remove(42)
+
+
+@pytest.mark.skipif(not _has_sqlalchemy_psycopg2, reason="psycopg2 is not supported")
+def test_router():
+    """Check that engines are created per shard upon first use."""
+    router = ShardRouter(HashRing(["a", "b", "c"]), _url_for_shard, pool_size=2)
+
+    engine = router.get("key")
+    assert len(router) == 1
+    assert router.get("key") is engine
+    assert engine is router.engine(router.shard_map.get("key"))
+    assert engine.pool.size() == 2
+
+    router.dispose()
+    assert len(router) == 0
+
+
+@pytest.mark.skipif(not _has_sqlalchemy_psycopg2, reason="psycopg2 is not supported")
+def test_fan_out():
+    router = ShardRouter(RangeMap([(0, "a"), (100, "b"), (200, "d")]), _url_for_shard)
+
+    with patch(
+        "sqlalchemy_rdsiam.tokens.generate_db_auth_tokens",
+        side_effect=lambda endpoints, region: [f"token-{region}" for _ in endpoints],
+    ) as generate_tokens:
+        build._shared_tokens.clear()
+
+        results = router.fan_out(lambda engine: engine.url.host)
+
+        assert results == {"a": "a", "b": "b", "d": "d"}
+        assert router.fan_out(lambda engine: engine.url.host, ["b"]) == {"b": "b"}
+
+    # Tokens of new shards are generated in one batch per region
+    assert generate_tokens.call_count == 2
+    assert build._shared_tokens[("us-east-2", "b", 5432, "user")][1] == (
+        "token-us-east-2"
+    )
+    assert build._shared_tokens[("us-west-2", "d", 5432, "user")][1] == (
+        "token-us-west-2"
+    )
+
+    def _fail(engine):
+        raise RuntimeError(engine.url.host)
+
+    with pytest.raises(RuntimeError):
+        router.fan_out(_fail)
+
+    router.dispose()
+
+
+@pytest.mark.skipif(not _has_sqlalchemy_asyncpg, reason="asyncpg is not supported")
+def test_fan_out_async(mock_boto_client):
+    """Check that tokens are generated outside of the event loop, and that
+    failures wait for all calls.
+    """
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    done = []
+
+    async def _host(engine):
+        await asyncio.sleep(0)
+        done.append(engine.url.host)
+        return engine.url.host
+
+    async def _fail(engine):
+        if engine.url.host == "a":
+            raise RuntimeError(engine.url.host)
+
+        return await _host(engine)
+
+    def _generate_tokens(endpoints, region):
+        threads.append(threading.current_thread())
+        return [f"token-{region}" for _ in endpoints]
+
+    async def _test():
+        router = ShardRouter(
+            HashRing(["a", "b"]),
+            lambda shard: f"postgresql+asyncpgrdsiam://user@{shard}/db",
+            create_engine_fn=create_async_engine,
+        )
+
+        assert await router.fan_out_async(_host) == {"a": "a", "b": "b"}
+
+        done.clear()
+
+        with pytest.raises(RuntimeError):
+            await router.fan_out_async(_fail)
+
+        assert done == ["b"]
+
+        with pytest.raises(TypeError):
+            router.dispose()
+
+        await router.aremove("a")
+        assert "a" not in router
+
+        await router.adispose()
+        assert len(router) == 0
+
+    threads = []
+
+    with patch(
+        "sqlalchemy_rdsiam.tokens.generate_db_auth_tokens",
+        side_effect=_generate_tokens,
+    ):
+        build._shared_tokens.clear()
+        asyncio.run(_test())
+
+    assert threads and threading.main_thread() not in threads
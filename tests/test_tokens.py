@@ -0,0 +1,86 @@
+"""
+Copyright 2022 Cisco Systems, Inc.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    https://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import datetime
+from typing import Dict
+from urllib.parse import parse_qs, urlsplit
+
+import boto3
+import pytest
+
+from sqlalchemy_rdsiam import tokens
+
+
+@pytest.fixture(params=[None, "session/token+="])
+def aws_credentials(request, monkeypatch):
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "AKIDEXAMPLE")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "secret")
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "eu-west-1")
+
+    if request.param is None:
+        monkeypatch.delenv("AWS_SESSION_TOKEN", raising=False)
+    else:
+        monkeypatch.setenv("AWS_SESSION_TOKEN", request.param)
+
+    tokens._session.cache_clear()
+    tokens._signing_key.cache_clear()
+    yield
+    tokens._session.cache_clear()
+    tokens._signing_key.cache_clear()
+
+
+@pytest.mark.parametrize("host", ["host.example.com", "My-Host.example.com"])
+def test_same_as_boto3(aws_credentials, host):
+    """Check that tokens are the same as the ones generated by boto3."""
+    client = boto3.session.Session().client("rds", region_name="us-east-2")
+    expected = client.generate_db_auth_token(
+        DBHostname=host, Port=5432, DBUsername="some user"
+    )
+
+    # Sign at the same time as boto3
+    expected_params = _params(expected)
+    now = datetime.datetime.strptime(expected_params["X-Amz-Date"], "%Y%m%dT%H%M%SZ")
+    credentials = tokens._session().get_credentials().get_frozen_credentials()
+
+    token = tokens._presign(host, 5432, "some user", "us-east-2", credentials, now)
+
+    assert token.startswith(f"{host}:5432/?")
+    assert _params(token) == expected_params
+
+
+def test_batch(aws_credentials):
+    """Check that the signing key is reused across instances."""
+    endpoints = [(f"host-{i}.example.com", 5432, "user") for i in range(10)]
+
+    batch = tokens.generate_db_auth_tokens(endpoints)
+
+    assert len(batch) == len(endpoints)
+    assert all(
+        token.startswith(f"{host}:{port}/?")
+        for token, (host, port, _) in zip(batch, endpoints)
+    )
+    assert all("eu-west-1" in _params(token)["X-Amz-Credential"] for token in batch)
+    assert tokens._signing_key.cache_info().misses == 1
+
+    token = tokens.generate_db_auth_token(
+        "host.example.com", 5432, "user", region_name="us-east-2"
+    )
+
+    assert "us-east-2" in _params(token)["X-Amz-Credential"]
+    assert tokens._signing_key.cache_info().misses == 2
+
+
+def _params(token: str) -> Dict[str, str]:
+    return {k: v[0] for k, v in parse_qs(urlsplit(f"https://{token}").query).items()}
@@ -0,0 +1,179 @@
+"""
+Copyright 2022 Cisco Systems, Inc.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    https://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import asyncio
+import time
+from unittest.mock import patch
+
+import pytest
+import sqlalchemy
+
+from sqlalchemy_rdsiam.dialects import _has_sqlalchemy_asyncpg
+
+if _has_sqlalchemy_asyncpg:
+    import asyncpg
+    from sqlalchemy.ext.asyncio import create_async_engine
+    from sqlalchemy.pool import NullPool
+
+    from sqlalchemy_rdsiam import type_cache
+
+pytestmark = pytest.mark.skipif(
+    not _has_sqlalchemy_asyncpg, reason="asyncpg is not supported"
+)
+
+
+class _Connection:
+    """Stands for `asyncpg.Connection`, with the catalog in `types`."""
+
+    def __init__(self, types):
+        self.types = types
+        self.queries = []
+
+    async def _introspect_types(self, typeoids, timeout):
+        self.queries.append(list(typeoids))
+        return [self.types[oid] for oid in typeoids], None
+
+    def _drop_local_type_cache(self):
+        pass
+
+
+def _introspect(conn, typeoids):
+    types, _ = asyncio.run(conn._introspect_types(typeoids, None))
+    return [ti["oid"] for ti in types]
+
+
+def test_setup_from_url():
+    engine = create_async_engine("postgresql+asyncpgrdsiam://user@host/db")
+    assert type_cache.get_cache(engine) is None
+
+    engine = create_async_engine(
+        "postgresql+asyncpgrdsiam://user@host/db"
+        "?rds_type_cache=true&rds_type_cache_ttl=60"
+    )
+    cache = type_cache.get_cache(engine)
+    assert cache is not None
+    assert cache.ttl == 60.0
+
+
+def test_connection_class():
+    cache = type_cache.TypeCache(ttl=300)
+    connection_class = cache.connection_class()
+
+    assert issubclass(connection_class, asyncpg.Connection)
+    assert cache.connection_class() is connection_class
+
+
+def test_shared_types():
+    """Check that types introspected by one connection serve the others."""
+    cache = type_cache.TypeCache(ttl=300)
+    connection_class = cache.connection_class(_Connection)
+    types = {1: {"oid": 1}, 2: {"oid": 2}}
+
+    conn_1 = connection_class(types)
+    assert _introspect(conn_1, [1]) == [1]
+    assert conn_1.queries == [[1]]
+
+    conn_2 = connection_class(types)
+    assert _introspect(conn_2, [1]) == [1]
+    assert conn_2.queries == []
+
+    # Unknown types are queried
+    assert _introspect(conn_2, [2]) == [2]
+    assert conn_2.queries == [[2]]
+
+    # Then all types are served together
+    conn_3 = connection_class(types)
+    assert _introspect(conn_3, [2]) == [1, 2]
+    assert conn_3.queries == []
+
+    # Types asked for again are queried
+    assert _introspect(conn_3, [2]) == [2]
+    assert conn_3.queries == [[2]]
+
+
+def test_invalidate_on_change():
+    """Check that the cache is cleared when a type changed."""
+    cache = type_cache.TypeCache(ttl=300)
+    connection_class = cache.connection_class(_Connection)
+
+    conn_1 = connection_class({1: {"oid": 1}, 2: {"oid": 2}})
+    _introspect(conn_1, [1])
+    _introspect(conn_1, [2])
+
+    conn_2 = connection_class({1: {"oid": 1, "attrnames": ["y"]}})
+    _introspect(conn_2, [1])
+    _introspect(conn_2, [1])
+
+    assert cache.get_types([2]) is None
+    assert cache.get_types([1]) == [{"oid": 1, "attrnames": ["y"]}]
+
+
+def test_invalidate_on_drop():
+    cache = type_cache.TypeCache(ttl=300)
+    conn = cache.connection_class(_Connection)({1: {"oid": 1}})
+    _introspect(conn, [1])
+
+    conn._drop_local_type_cache()
+
+    assert cache.get_types([1]) is None
+
+
+def test_expire():
+    cache = type_cache.TypeCache(ttl=0.1)
+    cache.add_types([{"oid": 1}])
+    assert cache.get_types([1]) == [{"oid": 1}]
+
+    time.sleep(0.15)
+
+    assert cache.get_types([1]) is None
+
+
+def test_connect_type_cache(mock_boto_client, pg_instance):
+    """Check that fresh connections do not introspect known types."""
+    db_name = f"{pg_instance.dbname}_tmpl"
+    url = (
+        "postgresql+asyncpgrdsiam://"
+        f"{pg_instance.user}:@{pg_instance.host}:{pg_instance.port}/{db_name}"
+        "?rds_type_cache=true"
+    )
+    query = sqlalchemy.text("SELECT 'happy'::rds_mood, ARRAY['sad'::rds_mood]")
+
+    async def _test():
+        engine = create_async_engine(url, poolclass=NullPool)
+
+        async with engine.begin() as conn:
+            await conn.execute(sqlalchemy.text("DROP TYPE IF EXISTS rds_mood"))
+            await conn.execute(
+                sqlalchemy.text("CREATE TYPE rds_mood AS ENUM ('happy', 'sad')")
+            )
+
+        results = []
+
+        with patch.object(
+            asyncpg.Connection,
+            "_introspect_types",
+            side_effect=asyncpg.Connection._introspect_types,
+            autospec=True,
+        ) as introspect_types:
+            for _ in range(3):
+                async with engine.connect() as conn:
+                    results.append((await conn.execute(query)).one())
+
+        await engine.dispose()
+
+        assert results == [("happy", ["sad"])] * 3
+        assert introspect_types.call_count == 1
+
+    asyncio.run(_test())